@@ -0,0 +1,119 @@
+import os
+import glob
+import hashlib
+import logging
+import argparse
+import multiprocessing
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import yaml
+import generate_project_qa
+
+# Configure logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(process)d - %(levelname)s - %(message)s')
+
+# Function to collect the configuration files of a batch from a directory or a manifest
+def collect_config_paths(configs):
+    if os.path.isdir(configs):
+        paths = glob.glob(os.path.join(configs, '*.yaml')) + glob.glob(os.path.join(configs, '*.yml'))
+        return sorted(paths)
+
+    # A manifest is either a YAML list, a YAML mapping with a 'configs' list, or one path per line
+    base_dir = os.path.dirname(os.path.abspath(configs))
+    with open(configs, 'r') as file:
+        manifest = yaml.safe_load(file)
+    if isinstance(manifest, dict):
+        manifest = manifest.get('configs', [])
+    elif isinstance(manifest, str):
+        manifest = manifest.split()
+    return [path if os.path.isabs(path) else os.path.join(base_dir, path) for path in manifest or []]
+
+# Function to map every configuration file to its output directory, named after the file; configs sharing a
+# file name (e.g. a/config.yaml and b/config.yaml) get a short hash of their absolute path appended
+def project_dirs(config_paths, output_root):
+    names = [os.path.splitext(os.path.basename(path))[0] for path in config_paths]
+    dirs = {}
+    for path, name in zip(config_paths, names):
+        if names.count(name) > 1:
+            name = f"{name}-{hashlib.sha256(os.path.abspath(path).encode('utf-8')).hexdigest()[:8]}"
+        dirs[path] = os.path.join(output_root, name)
+    return dirs
+
+# Function to install the shared stage semaphores in every worker process
+def init_worker(io_limit, cpu_limit):
+    generate_project_qa.set_stage_limits(io_limit, cpu_limit)
+
+# Function to run one project in a worker; failures are reported instead of raised so the batch keeps going
+def run_project(config_path, project_dir, options):
+    base = {'config_path': config_path}
+    try:
+        config = generate_project_qa.read_config(config_path)
+        base['project_name'] = config.get('project_name')
+        results = generate_project_qa.run_config(config, output_dir=project_dir, **options)
+    except Exception as e:
+        logging.error(f"Project {config_path} failed: {e}")
+        return [dict(base, status='failed', error=str(e), traceback=traceback.format_exc())]
+    return [dict(base, **result) for result in results]
+
+# Function to run every project of the batch across a process pool
+def run_batch(config_paths, output_root, workers, io_workers, cpu_workers, options):
+    # Spawned workers avoid inheriting torch/tokenizer thread state from the parent
+    context = multiprocessing.get_context('spawn')
+    io_limit = context.BoundedSemaphore(io_workers)
+    cpu_limit = context.BoundedSemaphore(cpu_workers)
+
+    dirs = project_dirs(config_paths, output_root)
+    rows = []
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_worker, initargs=(io_limit, cpu_limit)) as executor:
+        futures = {executor.submit(run_project, path, dirs[path], options): path for path in config_paths}
+        for future in as_completed(futures):
+            path = futures[future]
+            try:
+                rows.extend(future.result())
+            except Exception as e:
+                # The worker itself died (e.g. out of memory), record it and keep going
+                logging.error(f"Worker for {path} crashed: {e}")
+                rows.append({'config_path': path, 'status': 'failed', 'error': str(e)})
+            logging.info(f"Finished {path} ({len(rows)} result rows so far)")
+    return rows
+
+# Main script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate QnA YAML for a batch of projects in parallel.")
+    parser.add_argument('--configs', type=str, required=True, help='Directory of configuration files or a manifest listing them')
+    parser.add_argument('--output_dir', type=str, default='batch_output', help='Directory for the per-project outputs')
+    parser.add_argument('--metrics_file', type=str, default='batch_metrics.csv', help='Path of the aggregated metrics CSV')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Number of worker processes')
+    parser.add_argument('--io_workers', type=int, help='Maximum number of workers cloning/reading at the same time (default: workers)')
+    parser.add_argument('--cpu_workers', type=int, help='Maximum number of workers encoding at the same time (default: half of workers)')
+    parser.add_argument('--save_scores', action='store_true', help='Flag to save the scores of the models')
+    parser.add_argument('--pushgateway_url', type=str, help='URL of the Prometheus Pushgateway')
+    parser.add_argument('--enable_prometheus', action='store_true', help='Flag to enable Prometheus metrics')
+    parser.add_argument('--username', type=str, help='Username for Prometheus Pushgateway authentication')
+    parser.add_argument('--password', type=str, help='Password for Prometheus Pushgateway authentication')
+
+    args = parser.parse_args()
+
+    config_paths = collect_config_paths(args.configs)
+    if not config_paths:
+        parser.error(f"No configuration files found in {args.configs}")
+
+    workers = max(1, min(args.workers, len(config_paths)))
+    io_workers = args.io_workers or workers
+    cpu_workers = args.cpu_workers or max(1, workers // 2)
+    logging.info(f"Running {len(config_paths)} projects with {workers} workers ({io_workers} I/O, {cpu_workers} CPU)")
+
+    options = {
+        'save_scores': args.save_scores,
+        'pushgateway_url': args.pushgateway_url,
+        'enable_prometheus': args.enable_prometheus,
+        'username': args.username,
+        'password': args.password,
+    }
+    rows = run_batch(config_paths, args.output_dir, workers, io_workers, cpu_workers, options)
+
+    # pandas is only imported by the parent, spawned workers re-import this module and never need it
+    import pandas as pd
+    pd.DataFrame(rows).to_csv(args.metrics_file, index=False)
+    failed = sum(1 for row in rows if row.get('status') == 'failed')
+    logging.info(f"Aggregated metrics for {len(rows)} runs saved to {args.metrics_file} ({failed} failed)")
@@ -1,53 +1,31 @@
 import os
-import git
 import yaml
 import argparse
-import nltk
-from nltk.corpus import stopwords
-from collections import Counter
 import logging
+from segmentation import ensure_nltk_data, NLTK_RESOURCES as SEGMENTATION_NLTK_RESOURCES
 
 # Setup logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Download necessary NLTK data if not already downloaded
-nltk.download('stopwords')
-nltk.download('punkt')
-
-# CLI for asking repo_url, clone_dir, project_name, and commit_id
-parser = argparse.ArgumentParser(description="Clone a GitHub repo and generate a configuration YAML file.")
-parser.add_argument('repo_url', type=str, help='The URL of the GitHub repository to clone')
-parser.add_argument('clone_dir', type=str, help='The directory where the repository will be cloned')
-parser.add_argument('--project_name', type=str, default="InstructLab", help='The name of the project')
-parser.add_argument('--commit_id', type=str, default="83d9852ad97c6b27d4b24508f7cfe7ff5dd04d0d", help='The commit ID of the repository')
-
-args = parser.parse_args()
-repo_url = args.repo_url
-clone_dir = args.clone_dir
-project_name = args.project_name
-commit_id = args.commit_id
-
-# Clone the repository
-if not os.path.exists(clone_dir):
-    git.Repo.clone_from(repo_url, clone_dir)
-
-# Function to find files and create patterns
-def find_files_and_patterns(base_dir):
+# NLTK data used for keyword extraction plus the tokenizer data generate_project_qa.py needs, as (package, resource path);
+# NLTK, GitPython and the repository analyzer are imported only when they are needed, so --help answers immediately
+NLTK_RESOURCES = [('stopwords', 'corpora/stopwords')] + SEGMENTATION_NLTK_RESOURCES
+
+# Function to create patterns matching every file extension found in the repository
+def find_files_and_patterns(rel_paths):
     file_extensions = set()
     max_depth = 0
 
-    for root, _, filenames in os.walk(base_dir):
-        # Calculate the depth of the current directory
-        depth = root[len(base_dir):].count(os.sep)
-        max_depth = max(max_depth, depth)
+    for rel_path in rel_paths:
+        # The depth of the directory holding the file
+        max_depth = max(max_depth, rel_path.count('/'))
+
+        filename = os.path.basename(rel_path)
+        file_extensions.add(os.path.splitext(filename)[1])
 
-        for filename in filenames:
-            file_extension = os.path.splitext(filename)[1]
-            file_extensions.add(file_extension)
-            
-            # Special case for README.md
-            if filename == 'README.md':
-                file_extensions.add('README.md')
+        # Special case for README.md
+        if filename == 'README.md':
+            file_extensions.add('README.md')
 
     patterns = set()
 
@@ -62,22 +40,15 @@ def find_files_and_patterns(base_dir):
 
     return sorted(patterns)
 
-# Function to extract keywords from README.md
-def extract_keywords_from_readme(readme_path, num_keywords=10):
-    stop_words = set(stopwords.words('english'))
-    word_counter = Counter()
-
+# Function to load the English stopwords of NLTK, or none when they cannot be installed
+def load_stop_words():
+    ensure_nltk_data(NLTK_RESOURCES)
+    from nltk.corpus import stopwords
     try:
-        with open(readme_path, 'r', errors='ignore') as file:
-            content = file.read().lower()
-            words = nltk.word_tokenize(content)
-            filtered_words = [word for word in words if word.isalnum() and word not in stop_words]
-            word_counter.update(filtered_words)
-    except Exception as e:
-        logging.error(f"Error reading file {readme_path}: {e}")
-
-    most_common_words = [word for word, _ in word_counter.most_common(num_keywords)]
-    return most_common_words
+        return set(stopwords.words('english'))
+    except LookupError:
+        logging.warning("NLTK stopwords are not available, ranking keywords without them")
+        return set()
 
 # Function to read files and handle errors
 def read_file(file_path):
@@ -90,95 +61,146 @@ def read_file(file_path):
         logging.error(f"Error reading file {file_path}: {e}")
         return ""
 
-# Get the matching patterns
-patterns = find_files_and_patterns(clone_dir)
-
-# Path to README.md
-readme_path = os.path.join(clone_dir, 'README.md')
-
-# Extract dynamic keywords from the README.md content
-dynamic_keywords = extract_keywords_from_readme(readme_path)
-
-# Define the full configuration data
-config_data = {
-    "project_name": project_name,
-    "repo_url": repo_url,
-    "commit_id": commit_id,
-    "patterns": patterns,
-    "yaml_path": "qna.yaml",
-    "max_files": 100,
-    "max_lines": 2000,
-    "keywords": dynamic_keywords,
-    "min_sentence_length": 5,
-    "min_answers": 5,
-    "questions": [
-        "What is {project_name}?",
-        "How to get started with {project_name}?",
-        "What problems is {project_name} aiming to solve?",
-        "Who created {project_name}?",
-        "How does {project_name} enable community collaboration?",
-        "Is {project_name} an open-source project?",
-        "What is the tuning method for {project_name}?",
-        "What is the mission of {project_name}?",
-        "What technologies or programming languages is {project_name} developed in?",
-        "What are the key features of {project_name}?",
-        "What are the current limitations of {project_name}?",
-        "How can contributors improve {project_name}?",
-        "What are the future goals for {project_name}?",
-        "How is {project_name} maintained and updated?",
-        "What are the recommended best practices for using {project_name}?",
-        "What are the main challenges faced by {project_name}?"
-    ],
-    "chat": {
-        "enabled": True,
-        "model": "deepset/roberta-base-squad2"
-    },
-    "generate": {
-        "enabled": True,
-        "model": "deepset/roberta-base-squad2",
-        "taxonomy_path": "~/instructlab/taxonomy",
-        "taxonomy_base": "~/instructlab/taxonomy"
-    },
-    "serve": {
-        "enabled": True,
-        "model_path": "~/instructlab/models/roberta-base-squad2"
-    },
-    "taxonomy_dir": "~/instructlab/taxonomy",
-    "pushgateway_url": "http://your-pushgateway-url:9091",
-    "username": "your_username",
-    "password": "your_password",
-    "model_name": "deepset/roberta-base-squad2",
-    "optimize": False,
-    "model_list": [
-        "deepset/roberta-base-squad2",
-        "bert-large-uncased-whole-word-masking-finetuned-squad",
-        "distilbert-base-cased-distilled-squad",
-        "albert-base-v2",
-        "t5-base",
-        "ibm/labradorite-13b",
-        "ibm/merlinite-7b",
-        "ibm/re2g-reranker-trex"
-    ]
-}
-
-# Write the data to a YAML file
-yaml_file = "config.yaml"
-with open(yaml_file, 'w') as file:
-    yaml.dump(config_data, file, default_flow_style=False)
-
-# Append the available models as comments in the YAML file
-with open(yaml_file, 'a') as file:
-    file.write("\n# Available models:\n")
-    file.write("# - deepset/roberta-base-squad2\n")
-    file.write("# - bert-large-uncased-whole-word-masking-finetuned-squad\n")
-    file.write("# - distilbert-base-cased-distilled-squad\n")
-    file.write("# - albert-base-v2\n")
-    file.write("# - t5-base\n")
-    file.write("# - ibm/labradorite-13b\n")
-    file.write("# - ibm/merlinite-7b\n")
-    file.write("# - ibm/re2g-reranker-trex\n")
-    file.write("#\n")
-    file.write("# To find more models, visit https://huggingface.co/models\n")
-    file.write("# https://huggingface.co/models?pipeline_tag=question-answering\n")
-
-print(f"Repository cloned to '{clone_dir}' and '{yaml_file}' generated successfully with dynamic keywords: {dynamic_keywords}.")
+# Main script: ask for repo_url, clone_dir, project_name and commit_id, clone the repository and write config.yaml
+def main():
+    parser = argparse.ArgumentParser(description="Clone a GitHub repo and generate a configuration YAML file.")
+    parser.add_argument('repo_url', type=str, help='The URL of the GitHub repository to clone')
+    parser.add_argument('clone_dir', type=str, help='The directory where the repository will be cloned')
+    parser.add_argument('--project_name', type=str, default="InstructLab", help='The name of the project')
+    parser.add_argument('--commit_id', type=str, default="83d9852ad97c6b27d4b24508f7cfe7ff5dd04d0d", help='The commit ID of the repository')
+    parser.add_argument('--num_keywords', type=int, default=10, help='Number of keywords ranked from the documentation')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='Worker processes analyzing large repositories')
+
+    args = parser.parse_args()
+    repo_url = args.repo_url
+    clone_dir = args.clone_dir
+    project_name = args.project_name
+    commit_id = args.commit_id
+
+    # Clone the repository
+    if not os.path.exists(clone_dir):
+        import git
+        git.Repo.clone_from(repo_url, clone_dir)
+
+    # Analyze every file in one pass: documentation keywords, per-extension sizes and suggested limits
+    from repo_analyzer import analyze_repository
+    analysis = analyze_repository(clone_dir, args.workers, load_stop_words(), args.num_keywords)
+    for extension, stats in list(analysis['extensions'].items())[:10]:
+        logging.info(f"{extension}: {stats['files']} files ({stats['text_files']} text), {stats['lines']} lines, median {stats['median_lines']}, p90 {stats['p90_lines']}, max {stats['max_lines']} lines per file")
+
+    # Get the matching patterns
+    patterns = find_files_and_patterns(analysis['paths'])
+
+    # Keywords ranked by TF-IDF over the documentation files
+    dynamic_keywords = analysis['keywords']
+    logging.info(f"Suggested limits: max_files {analysis['max_files']}, max_lines {analysis['max_lines']}")
+
+    # Define the full configuration data
+    config_data = {
+        "project_name": project_name,
+        "repo_url": repo_url,
+        "commit_id": commit_id,
+        "patterns": patterns,
+        "yaml_path": "qna.yaml",
+        "max_files": analysis['max_files'],
+        "max_lines": analysis['max_lines'],
+        "max_file_bytes": 10485760,
+        "read_workers": 4,
+        "keywords": dynamic_keywords,
+        "keyword_word_boundary": False,
+        "keyword_stemming": False,
+        "min_keyword_density": 0.0,
+        "min_sentence_length": 5,
+        "min_answers": 5,
+        "top_k": 1,
+        "score_threshold": None,
+        "vector_index": "exact",
+        "vector_index_params": {},
+        "vector_index_recall": False,
+        "segment_workers": 1,
+        "incremental": False,
+        "profile_stages": [],
+        "questions": [
+            "What is {project_name}?",
+            "How to get started with {project_name}?",
+            "What problems is {project_name} aiming to solve?",
+            "Who created {project_name}?",
+            "How does {project_name} enable community collaboration?",
+            "Is {project_name} an open-source project?",
+            "What is the tuning method for {project_name}?",
+            "What is the mission of {project_name}?",
+            "What technologies or programming languages is {project_name} developed in?",
+            "What are the key features of {project_name}?",
+            "What are the current limitations of {project_name}?",
+            "How can contributors improve {project_name}?",
+            "What are the future goals for {project_name}?",
+            "How is {project_name} maintained and updated?",
+            "What are the recommended best practices for using {project_name}?",
+            "What are the main challenges faced by {project_name}?"
+        ],
+        "chat": {
+            "enabled": True,
+            "model": "deepset/roberta-base-squad2"
+        },
+        "generate": {
+            "enabled": True,
+            "model": "deepset/roberta-base-squad2",
+            "taxonomy_path": "~/instructlab/taxonomy",
+            "taxonomy_base": "~/instructlab/taxonomy"
+        },
+        "serve": {
+            "enabled": True,
+            "model_path": "~/instructlab/models/roberta-base-squad2"
+        },
+        "taxonomy_dir": "~/instructlab/taxonomy",
+        "pushgateway_url": "http://your-pushgateway-url:9091",
+        "pushgateway_timeout": 10,
+        "pushgateway_retries": 5,
+        "pushgateway_queue_size": 100,
+        "qa_metadata_export": "compact",
+        "username": "your_username",
+        "password": "your_password",
+        "model_name": "deepset/roberta-base-squad2",
+        "cache_dir": "~/.cache/instructlab-qa-generator",
+        "embedding_cache_max_mb": 1024,
+        "checkpoints": True,
+        "checkpoint_max_mb": 512,
+        "max_resident_models": 2,
+        "optimize": False,
+        "model_workers": 1,
+        "model_list": [
+            "deepset/roberta-base-squad2",
+            "bert-large-uncased-whole-word-masking-finetuned-squad",
+            "distilbert-base-cased-distilled-squad",
+            "albert-base-v2",
+            "t5-base",
+            "ibm/labradorite-13b",
+            "ibm/merlinite-7b",
+            "ibm/re2g-reranker-trex"
+        ]
+    }
+
+    # Write the data to a YAML file
+    yaml_file = "config.yaml"
+    with open(yaml_file, 'w') as file:
+        yaml.dump(config_data, file, default_flow_style=False)
+
+    # Append the available models as comments in the YAML file
+    with open(yaml_file, 'a') as file:
+        file.write("\n# Available models:\n")
+        file.write("# - deepset/roberta-base-squad2\n")
+        file.write("# - bert-large-uncased-whole-word-masking-finetuned-squad\n")
+        file.write("# - distilbert-base-cased-distilled-squad\n")
+        file.write("# - albert-base-v2\n")
+        file.write("# - t5-base\n")
+        file.write("# - ibm/labradorite-13b\n")
+        file.write("# - ibm/merlinite-7b\n")
+        file.write("# - ibm/re2g-reranker-trex\n")
+        file.write("#\n")
+        file.write("# To find more models, visit https://huggingface.co/models\n")
+        file.write("# https://huggingface.co/models?pipeline_tag=question-answering\n")
+
+    print(f"Repository cloned to '{clone_dir}' and '{yaml_file}' generated successfully with dynamic keywords: {dynamic_keywords}.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+import os
+import re
+import logging
+from collections import deque
+
+# File discovery shared by the QnA pipeline and the config generator: glob patterns compiled into one matcher,
+# a single walk of the checkout and binary file detection. It has no third-party dependencies, so analysis
+# worker processes start without importing the pipeline.
+
+# Bytes sniffed at the start of a file to tell binary files apart, and the characters text files are made of
+SNIFF_BYTES = 1024
+TEXT_CHARACTERS = bytes({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)))
+
+# Function to determine if the first block of a file is binary
+def looks_binary(chunk):
+    return bool(bytes(chunk).translate(None, TEXT_CHARACTERS))
+
+# Function to determine if a file is binary
+def is_binary_file(file_path):
+    with open(file_path, 'rb') as file:
+        chunk = file.read(SNIFF_BYTES)
+    return looks_binary(chunk)
+
+# Directories that are never searched for project files
+PRUNED_DIRS = {'.git', 'node_modules', 'vendor', 'third_party', '__pycache__', '.venv', 'venv', '.tox', 'site-packages'}
+
+# Function to translate one path component of a glob pattern into a regular expression
+def glob_component_to_regex(component):
+    regex = ''
+    i = 0
+    while i < len(component):
+        char = component[i]
+        if char == '*':
+            regex += '[^/]*'
+        elif char == '?':
+            regex += '[^/]'
+        elif char == '[' and component.find(']', i + 2) != -1:
+            end = component.find(']', i + 2)
+            body = component[i + 1:end].replace('\\', '\\\\')
+            if body.startswith('!'):
+                body = '^' + body[1:]
+            regex += f'[{body}]'
+            i = end
+        else:
+            regex += re.escape(char)
+        i += 1
+    # Like glob.glob, wildcards do not match hidden names
+    if re.search(r'[*?\[]', component) and not component.startswith('.'):
+        regex = r'(?!\.)' + regex
+    return regex
+
+# Function to translate a recursive glob pattern into a regular expression over '/'-separated relative paths
+def glob_to_regex(pattern):
+    components = pattern.strip('/').split('/')
+    regex = ''
+    for index, component in enumerate(components):
+        last = index == len(components) - 1
+        if component == '**':
+            regex += r'(?!\.)[^/]+(?:/(?!\.)[^/]+)*' if last else r'(?:(?!\.)[^/]+/)*'
+        else:
+            regex += glob_component_to_regex(component) + ('' if last else '/')
+    return regex
+
+# Function to compile all patterns into a single matcher
+def compile_patterns(patterns):
+    return re.compile('|'.join(f'(?:{glob_to_regex(pattern)})' for pattern in patterns))
+
+# Function to walk a checkout once and yield the files matching any pattern, shallowest directories first
+def discover_files(base_dir, patterns, max_files=None):
+    matcher = compile_patterns(patterns)
+    # Without '**' no pattern can match below the deepest pattern, so deeper directories are not walked
+    max_depth = None if any('**' in pattern for pattern in patterns) else max((pattern.strip('/').count('/') for pattern in patterns), default=0)
+
+    found = 0
+    pending = deque([('', 0)])
+    while pending:
+        rel_dir, depth = pending.popleft()
+        try:
+            with os.scandir(os.path.join(base_dir, rel_dir)) as iterator:
+                entries = sorted(iterator, key=lambda entry: entry.name)
+        except OSError as e:
+            logging.warning(f"Skipping unreadable directory {rel_dir}: {e}")
+            continue
+        for entry in entries:
+            rel_path = f'{rel_dir}/{entry.name}' if rel_dir else entry.name
+            if entry.is_dir(follow_symlinks=False):
+                if entry.name not in PRUNED_DIRS and (max_depth is None or depth < max_depth):
+                    pending.append((rel_path, depth + 1))
+            elif entry.is_file() and matcher.fullmatch(rel_path):
+                yield entry.path
+                found += 1
+                if max_files is not None and found >= max_files:
+                    return
@@ -1,207 +1,717 @@
-import git
 import yaml
 import os
-import glob
+import re
 import logging
-from sentence_transformers import SentenceTransformer, util
+import numpy as np
+import hashlib
+import json
 import argparse
-import pandas as pd
 import time
-from prometheus_client import CollectorRegistry, Gauge, generate_latest, Info
-import requests
-from requests.auth import HTTPBasicAuth
-from nltk.tokenize import sent_tokenize, blankline_tokenize  # Ensure this is imported
+import gc
+import mmap
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from collections import OrderedDict, Counter, deque
+from itertools import product
+from contextlib import contextmanager, ExitStack
+from qa_cache import EmbeddingCache, SegmentCache, ArtifactStore, StageCache, DEFAULT_CACHE_DIR, content_key, json_key, incremental_state_dir, load_state, save_state
+from vector_index import ExactIndex, build_index, index_exists, index_files, load_index, save_index, recall_at_k
+from repo_mirror import checkout_repo, update_mirror, changed_paths
+from file_discovery import SNIFF_BYTES, looks_binary, compile_patterns, discover_files
+from segmentation import segment_texts, iter_segment_tasks, ensure_nltk_data
+from tracing import span, traced, trace_run, save_trace, attach_trace
+
+# sentence_transformers (torch), pandas, prometheus_client, NLTK and requests are imported by the functions that use them,
+# so --help and runs that skip a stage do not pay seconds of import time for it
 
 # Configure logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Optional semaphores bounding how many processes run the I/O stages (clone/read)
+# and the CPU stages (model load/encode) at the same time, installed by batch workers
+_stage_limits = {'io': None, 'cpu': None}
+
+# Function to install the stage semaphores for this process
+def set_stage_limits(io_limit=None, cpu_limit=None):
+    _stage_limits['io'] = io_limit
+    _stage_limits['cpu'] = cpu_limit
+
+# Function to hold the semaphore of a stage while it runs, if one is installed
+@contextmanager
+def stage_limit(stage):
+    limit = _stage_limits.get(stage)
+    if limit is None:
+        yield
+        return
+    with limit:
+        yield
+
 # Function to read the configuration file
 def read_config(config_path):
     with open(config_path, 'r') as file:
         config = yaml.safe_load(file)
     return config
 
-# Function to determine if a file is binary
-def is_binary_file(file_path):
-    with open(file_path, 'rb') as file:
-        chunk = file.read(1024)
-    text_characters = bytearray({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)))
-    return bool(chunk.translate(None, text_characters))
+# Files at least this large are memory-mapped and decoded in place instead of being read into a bytes copy first
+MMAP_MIN_BYTES = 1024 * 1024
 
-# Function to read the Git repository
-def read_git_repo(repo_url, commit_id, patterns, max_files):
-    repo_dir = "/tmp/repo"
-    if os.path.exists(repo_dir):
-        os.system(f"rm -rf {repo_dir}")
+# Default size above which files are skipped, and the number of files read ahead of extraction per reader thread
+DEFAULT_MAX_FILE_BYTES = 10 * 1024 * 1024
+READ_AHEAD_PER_WORKER = 2
 
-    logging.info(f"Cloning repository {repo_url}")
-    start_time = time.time()
-    repo = git.Repo.clone_from(repo_url, repo_dir)
-    repo.git.checkout(commit_id)
-    clone_time = time.time() - start_time
-    
-    content = {}
+# Function to read a UTF-8 text file with a single open: the first block is sniffed for binary content, large files are
+# memory-mapped, and newlines are translated like text mode does. Returns None for binary, oversized and undecodable files.
+def read_text_file(file_path, max_file_bytes=None):
+    try:
+        with open(file_path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if max_file_bytes is not None and size > max_file_bytes:
+                logging.warning(f"Skipping file larger than {max_file_bytes} bytes: {file_path} ({size} bytes)")
+                return None
+            if size >= MMAP_MIN_BYTES:
+                with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                    if looks_binary(data[:SNIFF_BYTES]):
+                        logging.warning(f"Skipping binary file: {file_path}")
+                        return None
+                    content = str(data, 'utf-8')
+            else:
+                data = file.read()
+                if looks_binary(data[:SNIFF_BYTES]):
+                    logging.warning(f"Skipping binary file: {file_path}")
+                    return None
+                content = data.decode('utf-8')
+    except UnicodeDecodeError as e:
+        logging.error(f"Error reading file {file_path}: {e}")
+        return None
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return content
+
+# Uncached text below this many characters is segmented inline; workers spend about two seconds importing NLTK,
+# so a process pool only pays off above it
+SEGMENT_POOL_MIN_CHARS = 4 * 1024 * 1024
+
+# Bucket bounds of the compact Q&A metadata histograms: answer length in words and cosine similarity score
+ANSWER_LENGTH_BUCKETS = (5, 10, 15, 20, 30, 40, 60, 80, 120, float('inf'))
+ANSWER_SCORE_BUCKETS = (0.1, 0.2, 0.3, 0.4, 0.5, 0.6, 0.7, 0.8, 0.9, 1.0, float('inf'))
+
+# Columns of the model leaderboard and the metrics it ranks by, best first
+LEADERBOARD_COLUMNS = ['model_name', 'status', 'answer_coverage', 'qa_count', 'mean_score', 'min_score', 'encode_sentences_per_s', 'model_load_time', 'qa_generation_time', 'total_time', 'error']
+LEADERBOARD_RANKING = ['answer_coverage', 'mean_score', 'min_score', 'encode_sentences_per_s']
+
+# Function to stream the matching files of a checked out Git repository in discovery order.
+# read_workers threads read a few files ahead of the consumer, so only a bounded number of files is in memory at a time.
+# Files whose relative path is in unchanged are not read, their content is yielded as None.
+def read_git_repo(repo_dir, patterns, max_files, unchanged=None, max_file_bytes=DEFAULT_MAX_FILE_BYTES, read_workers=1):
+    files = traced(discover_files(repo_dir, patterns), 'discover', 'files')
+    read_ahead = max(1, read_workers) * READ_AHEAD_PER_WORKER
+    executor = ThreadPoolExecutor(max_workers=max(1, read_workers), thread_name_prefix='reader')
+    pending = deque()
     file_count = 0
-    for pattern in patterns:
-        file_paths = glob.glob(os.path.join(repo_dir, pattern), recursive=True)
-        for file_path in file_paths:
-            if os.path.isdir(file_path):
-                continue
-            if file_count >= max_files:
+    try:
+        # Skipped files do not count towards max_files, so discovery is consumed lazily until the limit is hit
+        while file_count < max_files:
+            while len(pending) < read_ahead:
+                file_path = next(files, None)
+                if file_path is None:
+                    break
+                if unchanged and os.path.relpath(file_path, repo_dir) in unchanged:
+                    pending.append((file_path, None))
+                else:
+                    pending.append((file_path, executor.submit(read_text_file, file_path, max_file_bytes)))
+            if not pending:
                 break
-            if is_binary_file(file_path):
-                logging.warning(f"Skipping binary file: {file_path}")
+            file_path, future = pending.popleft()
+            content = future.result() if future is not None else None
+            if future is not None and content is None:
                 continue
-            start_time = time.time()
-            try:
-                with open(file_path, 'r', encoding='utf-8') as file:
-                    content[file_path] = file.read()
-                read_time = time.time() - start_time
-                file_count += 1
-                logging.info(f"Read file: {file_path} in {read_time:.2f} seconds")
-            except UnicodeDecodeError as e:
-                logging.error(f"Error reading file {file_path}: {e}")
+            file_count += 1
+            yield file_path, content
+    finally:
+        # Files read ahead past the end of the corpus are dropped
+        executor.shutdown(wait=True, cancel_futures=True)
+
+# Function to stream the lines of the files until max_lines lines have been produced in total
+def iter_capped_lines(files, max_lines):
+    remaining = max_lines
+    if remaining <= 0:
+        return
+    for file_path, content in files:
+        for line_number, line in enumerate(content.split('\n'), start=1):
+            yield file_path, line_number, line
+            remaining -= 1
+            if remaining <= 0:
+                # Return before pulling the next file so it is never read
+                return
+
+# Function to group lines into blank-line separated paragraphs, yielding (file_path, first_line, paragraph)
+def iter_paragraphs(lines):
+    current_file, first_line, buffer = None, None, []
+    for file_path, line_number, line in lines:
+        if file_path != current_file or not line.strip():
+            if buffer:
+                yield current_file, first_line, "\n".join(buffer).strip()
+            current_file, first_line, buffer = file_path, None, []
+            if not line.strip():
                 continue
-        if file_count >= max_files:
-            break
-    
-    return content, clone_time, file_count
-
-# Function to extract relevant sections based on keywords
-def extract_relevant_sections(text, keywords):
-    sections = []
-    paragraphs = blankline_tokenize(text)
-    for paragraph in paragraphs:
-        for keyword in keywords:
-            if keyword.lower() in paragraph.lower():
-                sections.append(paragraph)
-                break
-    logging.info(f"Extracted {len(sections)} relevant sections")
-    return sections
-
-# Function to combine relevant sections for better context
-def combine_relevant_sections(sections):
-    combined_sections = []
-    current_section = ""
-    for section in sections:
-        if len(current_section) + len(section) < 4096:
-            current_section += " " + section
+        if first_line is None:
+            first_line = line_number
+        buffer.append(line)
+    if buffer:
+        yield current_file, first_line, "\n".join(buffer).strip()
+
+# Pseudo-characters used in the keyword trie for 'any whitespace' and 'rest of a stemmed word'
+TRIE_SPACE = '\x00space'
+TRIE_WORD_END = '\x00word'
+TRIE_END = ''
+
+# Function to emit a regular expression for a keyword trie, sharing common prefixes between keywords
+def trie_to_regex(node):
+    alternatives = []
+    for token, child in sorted(node.items()):
+        if token == TRIE_END:
+            continue
+        if token == TRIE_SPACE:
+            alternatives.append(r'\s+' + trie_to_regex(child))
+        elif token == TRIE_WORD_END:
+            alternatives.append(r'\w*' + trie_to_regex(child))
         else:
-            combined_sections.append(current_section.strip())
-            current_section = section
-    if current_section:
-        combined_sections.append(current_section.strip())
-    return combined_sections
-
-# Function to generate questions and answers using specified models
-def generate_qa_pairs(sections, project_name, questions, min_sentence_length, model_name):
+            alternatives.append(re.escape(token) + trie_to_regex(child))
+    if not alternatives:
+        return ''
+    regex = alternatives[0] if len(alternatives) == 1 else '(?:' + '|'.join(alternatives) + ')'
+    # A keyword ends here but longer ones continue; the greedy '?' prefers the longest keyword
+    if TRIE_END in node:
+        regex = ('(?:' + regex + ')' if len(alternatives) == 1 else regex) + '?'
+    return regex
+
+# All keywords compiled into a single regular expression built from a trie of the lowercased keywords,
+# so each text is lowercased once and scanned once instead of once per keyword.
+# With stemming, every word matches its stem or its surface form followed by any suffix: a Porter stem is not
+# always a prefix of the word ('tuning' stems to 'tune'), so the surface form keeps every plain match.
+class KeywordMatcher:
+    def __init__(self, keywords, word_boundary=False, stem=False):
+        self.keywords = list(dict.fromkeys(keywords))
+        self.stemmer = None
+        if stem:
+            from nltk.stem import PorterStemmer
+            self.stemmer = PorterStemmer()
+        self.lookup = {}
+        self.prefixes = []
+        self.matched_keywords = {}
+        trie = {}
+        for keyword in self.keywords:
+            words = self._normalize(keyword)
+            if not words:
+                continue
+            self.lookup.setdefault(' '.join(words), keyword)
+            surface = keyword.lower().split()
+            self.prefixes.append((words, surface, keyword))
+            for variant in product(*({stem, word} for stem, word in zip(words, surface))):
+                node = trie
+                for index, word in enumerate(variant):
+                    if index:
+                        node = node.setdefault(TRIE_SPACE, {})
+                    for char in word:
+                        node = node.setdefault(char, {})
+                    if self.stemmer:
+                        node = node.setdefault(TRIE_WORD_END, {})
+                node[TRIE_END] = {}
+        regex = trie_to_regex(trie) if trie else None
+        if regex and word_boundary:
+            regex = rf'(?<!\w)(?:{regex})(?!\w)'
+        self.regex = re.compile(regex) if regex else None
+
+    # Lowercase, split and optionally stem the words of a keyword or of a matched text
+    def _normalize(self, text):
+        words = text.lower().split()
+        if self.stemmer:
+            words = [self.stemmer.stem(word) for word in words]
+        return words
+
+    # Map a matched text back to the keyword that produced it
+    def _keyword_for(self, matched):
+        if matched in self.matched_keywords:
+            return self.matched_keywords[matched]
+        keyword = self.lookup.get(' '.join(self._normalize(matched)))
+        if keyword is None:
+            # Stemming a longer inflection can give a different stem, so fall back to the stem and surface prefixes
+            words = matched.split()
+            for stems, surface, candidate in self.prefixes:
+                if len(stems) == len(words) and all(word.startswith(stem) or word.startswith(plain) for word, stem, plain in zip(words, stems, surface)):
+                    keyword = candidate
+                    break
+        self.matched_keywords[matched] = keyword
+        return keyword
+
+    # Return whether any keyword occurs in the text
+    def search(self, text):
+        return self.regex is not None and self.regex.search(text.lower()) is not None
+
+    # Count how often each keyword occurs in the text
+    def hits(self, text):
+        counts = Counter()
+        if self.regex is not None:
+            for matched in self.regex.findall(text.lower()):
+                counts[self._keyword_for(matched)] += 1
+        return counts
+
+# Function to compute how densely a section mentions the keywords, in hits per word
+def keyword_density(section, hits):
+    return sum(hits.values()) / max(len(section.split()), 1)
+
+# Function to keep only the paragraphs that mention at least one keyword, with the keyword hit counts
+def iter_relevant_sections(paragraphs, keywords, word_boundary=False, stem=False):
+    # A prebuilt matcher can be passed instead of the keywords when sections are extracted file by file
+    matcher = keywords if isinstance(keywords, KeywordMatcher) else KeywordMatcher(keywords, word_boundary, stem)
+    for file_path, line_number, paragraph in paragraphs:
+        # Most paragraphs do not match, so reject them with a plain search before counting hits
+        if matcher.search(paragraph):
+            yield file_path, line_number, paragraph, matcher.hits(paragraph)
+
+# Function to extract the relevant sections of each file, yielding (rel_path, record) with
+# record = {'lines': line count, 'truncated': bool, 'sections': [[line_number, section, hits], ...]}.
+# Files read as None are unchanged since the previous run and reuse its record unless max_lines now cuts them short.
+def iter_file_records(repo_dir, files, max_lines, matcher, previous_records=None, max_file_bytes=None):
+    remaining = max_lines
+    if remaining <= 0:
+        return
+    for file_path, content in files:
+        rel_path = os.path.relpath(file_path, repo_dir)
+        record = previous_records.get(rel_path) if content is None else None
+        if record is None or record['truncated'] or record['lines'] > remaining:
+            if content is None:
+                content = read_text_file(file_path, max_file_bytes)
+                if content is None:
+                    # Binary, oversized or undecodable now, skipped like read_git_repo skips it
+                    continue
+            line_count = content.count('\n') + 1
+            sections = iter_relevant_sections(iter_paragraphs(iter_capped_lines([(file_path, content)], remaining)), matcher)
+            record = {
+                'lines': min(line_count, remaining),
+                'truncated': line_count > remaining,
+                'sections': [[line_number, section, dict(hits)] for _, line_number, section, hits in sections],
+            }
+        remaining -= record['lines']
+        yield rel_path, record
+        if remaining <= 0:
+            # Return before pulling the next file so it is never read
+            return
+
+# Function to keep the sections that mention the keywords at least min_density times per word
+def filter_sections_by_density(sections, min_density):
+    return [section for section in sections if keyword_density(section[2], section[3]) >= min_density]
+
+# Function to segment every section into sentences, reusing cached segmentations and spreading the rest over worker processes
+def segment_sections(texts, segment_cache=None, workers=1):
+    keys = [content_key(text) for text in texts]
+    spans = segment_cache.get_many(keys) if segment_cache is not None else {}
+    missing = {key: text for key, text in zip(keys, texts) if key not in spans}
+
+    missing_texts = list(missing.values())
+    if missing_texts:
+        # Fetched once here, so worker processes never download the tokenizer data concurrently
+        ensure_nltk_data()
+    workers = min(workers, os.cpu_count() or 1)
+    if workers > 1 and sum(len(text) for text in missing_texts) >= SEGMENT_POOL_MIN_CHARS:
+        logging.info(f"Segmenting {len(missing_texts)} sections with {workers} worker processes")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn')) as executor:
+            segmented = [result for task_results in executor.map(segment_texts, iter_segment_tasks(missing_texts)) for result in task_results]
+    else:
+        segmented = segment_texts(missing_texts)
+
+    new_spans = dict(zip(missing, segmented))
+    if segment_cache is not None and new_spans:
+        segment_cache.put_many(new_spans)
+    spans.update(new_spans)
+    return [spans[key] for key in keys]
+
+# Models loaded in this process, least recently used first
+_model_pool = OrderedDict()
+
+# Function to load a SentenceTransformer model once per process and share it across calls
+def load_model(model_name, max_models=2):
+    if model_name in _model_pool:
+        _model_pool.move_to_end(model_name)
+        return _model_pool[model_name], 0.0
+
+    # Make room before loading so at most max_models stay resident
+    while _model_pool and len(_model_pool) >= max(max_models, 1):
+        evicted_name, _ = _model_pool.popitem(last=False)
+        logging.info(f"Unloading model {evicted_name} from the model pool")
+        gc.collect()
+
+    start_time = time.time()
+    from sentence_transformers import SentenceTransformer
     model = SentenceTransformer(model_name)
+    load_time = time.time() - start_time
+    _model_pool[model_name] = model
+    logging.info(f"Loaded model {model_name} in {load_time:.2f} seconds")
+    return model, load_time
+
+# Function to embed the context sentences, reusing cached embeddings when available
+def embed_context(context_sentences, model, embedding_cache=None):
+    if not context_sentences:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    with span('encode') as encode_span:
+        encode_span.count('sentences', len(context_sentences))
+        if embedding_cache is not None:
+            return embedding_cache.encode(model, context_sentences)
+        return model.encode(context_sentences, convert_to_numpy=True)
+
+# Function to compute the key a persisted index is stored under: the corpus sentences, the backend and its parameters
+def context_index_key(context_sentences, kind, params):
+    digest = hashlib.sha256(json.dumps([kind, params or {}], sort_keys=True).encode('utf-8'))
+    for sentence in context_sentences:
+        digest.update(content_key(sentence).encode('ascii'))
+    return digest.hexdigest()
+
+# Function to load the persisted vector index of a corpus, or embed the corpus and build the index.
+# Returns the index, whether it was loaded and the context embeddings, None when the index was loaded.
+# Only approximate indexes are persisted, an exact index is rebuilt cheaply from the embedding cache.
+# Persisted indexes are accounted in the embedding cache, so they are evicted with its shards.
+def prepare_context_index(context_sentences, model, embedding_cache=None, kind='exact', params=None, index_dir=None):
+    path = None
+    if index_dir and kind != 'exact':
+        path = os.path.join(index_dir, context_index_key(context_sentences, kind, params))
+        if index_exists(kind, path):
+            index = load_index(kind, path, params)
+            if embedding_cache is not None:
+                embedding_cache.track_files(index_files(kind, path))
+            return index, True, None
+
+    embeddings = embed_context(context_sentences, model, embedding_cache)
+    index = build_index(kind, embeddings, params)
+    if path:
+        save_index(index, path)
+        if embedding_cache is not None:
+            embedding_cache.track_files(index_files(kind, path))
+    return index, False, embeddings
+
+# Function to measure the recall@k of an approximate index against exact search for the given questions.
+# The embeddings the index was built from are reused, the corpus is only embedded again when the index was loaded.
+def measure_index_recall(context_index, context_sentences, question_texts, model, embedding_cache=None, top_k=10, context_embeddings=None):
+    question_embeddings = model.encode(question_texts, convert_to_numpy=True)
+    if context_embeddings is None:
+        context_embeddings = embed_context(context_sentences, model, embedding_cache)
+    exact_index = ExactIndex(context_embeddings)
+    _, approx_ids = context_index.search(question_embeddings, top_k)
+    _, exact_ids = exact_index.search(question_embeddings, top_k)
+    return recall_at_k(approx_ids, exact_ids)
+
+# Function to score all questions against the context index in one batch.
+# Returns, per question, up to top_k (sentence index, score) candidates, best first, at or above score_threshold.
+def score_questions(question_embeddings, context_index, top_k=1, score_threshold=None):
+    top_scores, top_ids = context_index.search(question_embeddings, max(top_k, 1))
+    results = []
+    for row_scores, row_ids in zip(top_scores, top_ids):
+        results.append([(int(index), float(score)) for index, score in zip(row_ids, row_scores) if index >= 0 and (score_threshold is None or score >= score_threshold)])
+    return results
+
+# Function to rank the answer candidates of every question, returning (sentence index, score) pairs per question, best first
+def rank_questions(question_texts, model, context_index, top_k=1, score_threshold=None):
+    # Embed all questions in one batch and score them against the whole context at once
+    question_embeddings = model.encode(question_texts, convert_to_numpy=True)
+    return score_questions(question_embeddings, context_index, top_k, score_threshold)
+
+# Function to select the answer of every question from its ranked candidates
+def select_answers(context_sentences, question_texts, ranked, min_sentence_length, context_sources=None, score_threshold=None):
     seed_examples = []
     scores = []
-    context = " ".join(sections)
-
-    # Embed the context once
-    context_sentences = sent_tokenize(context)
-    context_embeddings = model.encode(context_sentences, convert_to_tensor=True)
-
-    for question_template in questions:
-        question = question_template.format(project_name=project_name)
-        question_embedding = model.encode(question, convert_to_tensor=True)
-        
-        # Compute cosine similarity between the question and context sentences
-        cosine_scores = util.pytorch_cos_sim(question_embedding, context_embeddings)[0]
-        best_score, best_idx = cosine_scores.max().item(), cosine_scores.argmax().item()
-        
-        best_answer = context_sentences[best_idx]
-        logging.info(f"Processing question '{question}' with best answer: '{best_answer}' and score: {best_score}")
-
-        if len(best_answer.split()) >= min_sentence_length:
-            seed_examples.append({'question': question, 'answer': best_answer.strip()})
-            scores.append({'question': question, 'answer': best_answer.strip(), 'score': best_score})
-        else:
-            logging.warning(f"Skipped question '{question}' due to insufficient answer length. Answer: '{best_answer}', Length: {len(best_answer.split())}")
+    candidates = []
+
+    for question, question_candidates in zip(question_texts, ranked):
+        # The best candidate that is long enough becomes the answer
+        selected = next((rank for rank, (index, _) in enumerate(question_candidates) if len(context_sentences[index].split()) >= min_sentence_length), None)
+        for rank, (index, score) in enumerate(question_candidates):
+            candidates.append({'question': question, 'rank': rank, 'answer': context_sentences[index].strip(), 'score': score, 'selected': rank == selected, 'source': context_sources[index] if context_sources else None})
+
+        if selected is None:
+            if question_candidates:
+                best_answer = context_sentences[question_candidates[0][0]]
+                logging.warning(f"Skipped question '{question}' due to insufficient answer length. Answer: '{best_answer}', Length: {len(best_answer.split())}")
+            else:
+                logging.warning(f"Skipped question '{question}' because no answer scored at least {score_threshold}")
+            continue
 
-    return seed_examples, scores
+        index, score = question_candidates[selected]
+        answer = context_sentences[index].strip()
+        logging.info(f"Processing question '{question}' with best answer: '{answer}' and score: {score}")
+        seed_examples.append({'question': question, 'answer': answer})
+        scores.append({'question': question, 'answer': answer, 'score': score, 'source': context_sources[index] if context_sources else None})
+
+    return seed_examples, scores, candidates
+
+# Function to decide whether the answers of a previous incremental run still hold: the settings must match,
+# no sentence may have been added and every answer candidate must still be in the corpus, so no ranking can change.
+# Approximate indexes are rebuilt over the new corpus, so they only reuse answers of an identical corpus.
+def previous_answers_valid(previous, settings, sentence_keys):
+    if not previous or previous['settings'] != settings:
+        return False
+    if settings['vector_index'] != 'exact':
+        return previous['sentence_keys'] == sentence_keys
+    current = set(sentence_keys)
+    candidate_keys = (content_key(candidate['answer']) for candidate in previous['candidates'])
+    return current.issubset(previous['sentence_keys']) and all(key in current for key in candidate_keys)
+
+# Function to restore the answers of a previous incremental run, pointing their sources at the current corpus
+def restore_answers(previous, sentence_keys, context_sources=None):
+    sources = {}
+    if context_sources:
+        for key, source in zip(sentence_keys, context_sources):
+            sources.setdefault(key, source)
+    if context_sources:
+        for row in previous['scores'] + previous['candidates']:
+            row['source'] = sources.get(content_key(row['answer']))
+    return previous['seed_examples'], previous['scores'], previous['candidates']
 
 # Function to save scores to CSV
-def save_scores_to_csv(scores, model_name):
+def save_scores_to_csv(scores, model_name, output_dir='.'):
+    import pandas as pd
     df = pd.DataFrame(scores)
-    csv_path = f'scores_{model_name.replace("/", "_")}.csv'
+    csv_path = os.path.join(output_dir, f'scores_{model_name.replace("/", "_")}.csv')
     df.to_csv(csv_path, index=False)
     logging.info(f"Scores saved to {csv_path}")
 
+# Function to save the top-k answer candidates of every question to CSV
+def save_candidates_to_csv(candidates, model_name, output_dir='.'):
+    import pandas as pd
+    df = pd.DataFrame(candidates)
+    csv_path = os.path.join(output_dir, f'candidates_{model_name.replace("/", "_")}.csv')
+    df.to_csv(csv_path, index=False)
+    logging.info(f"Answer candidates saved to {csv_path}")
+
 # Function to save metrics to CSV
 def save_metrics_to_csv(metrics, metrics_file):
+    import pandas as pd
     df = pd.DataFrame([metrics])
     df.to_csv(metrics_file, index=False)
     logging.info(f"Metrics saved to {metrics_file}")
 
-# Function to push metrics to Prometheus Pushgateway with optional authentication
-def push_metrics_to_gateway(metrics, job_name, pushgateway_url, instance, username=None, password=None):
-    registry = CollectorRegistry()
-    for key, value in metrics.items():
-        if isinstance(value, (int, float)):
-            gauge = Gauge(key, f'Description of {key}', ['instance'], registry=registry)
-            gauge.labels(instance=instance).set(value)
-    data = generate_latest(registry)
-    
-    sanitized_instance = instance.replace("/", "-")
-    full_url = f"{pushgateway_url}/metrics/job/{job_name}/instance/{sanitized_instance}"
-    
-    if username and password:
-        response = requests.post(full_url, data=data, auth=HTTPBasicAuth(username, password))
-    else:
-        response = requests.post(full_url, data=data)
-    
-    if response.status_code != 200:
-        logging.error(f"Failed to push metrics to Pushgateway. URL: {full_url}, Status Code: {response.status_code}, Response: {response.text}")
-    else:
-        logging.info(f"Metrics successfully pushed to Pushgateway. URL: {full_url}")
+# Function to rank the models of a sweep and save the leaderboard as Parquet, or as CSV when no Parquet engine is installed
+def save_leaderboard(results, output_dir='.'):
+    import pandas as pd
+    df = pd.DataFrame(results).reindex(columns=LEADERBOARD_COLUMNS)
+    df = df.sort_values(LEADERBOARD_RANKING, ascending=False, na_position='last', kind='stable')
+    df.insert(0, 'rank', range(1, len(df) + 1))
+    os.makedirs(output_dir, exist_ok=True)
+    leaderboard_path = os.path.join(output_dir, 'leaderboard.parquet')
+    try:
+        df.to_parquet(leaderboard_path, index=False)
+    except ImportError:
+        logging.warning("No Parquet engine (pyarrow or fastparquet) is installed, saving the leaderboard as CSV")
+        leaderboard_path = os.path.join(output_dir, 'leaderboard.csv')
+        df.to_csv(leaderboard_path, index=False)
+    logging.info(f"Leaderboard of {len(df)} models saved to {leaderboard_path}, best model: {df['model_name'].iloc[0] if len(df) else None}")
+    return df
 
-# Function to push Q&A metadata to Prometheus Pushgateway with optional authentication
-def push_qa_metadata_to_gateway(seed_examples, job_name, pushgateway_url, instance, username=None, password=None):
-    registry = CollectorRegistry()
-    
+# Function to add the numeric metrics of every instance (model) to a registry, labelled by instance
+def build_metrics_registry(metrics_by_instance, registry=None):
+    from prometheus_client import CollectorRegistry, Gauge
+    registry = registry or CollectorRegistry()
+    gauges = {}
+    for instance, metrics in metrics_by_instance.items():
+        for key, value in metrics.items():
+            if isinstance(value, (int, float)):
+                if key not in gauges:
+                    gauges[key] = Gauge(key, f'Description of {key}', ['instance'], registry=registry)
+                gauges[key].labels(instance=instance).set(value)
+    return registry
+
+# Function to return the Q&A set of a model: every answered question with its answer, score and source
+def qa_set_rows(seed_examples, scores=None):
+    rows = [row for row in scores or [] if isinstance(row, dict)]
+    return rows or seed_examples
+
+# Function to add the Q&A metadata of every instance (model) to a registry, labelled by instance.
+# The 'compact' export pushes histograms of the answer lengths and scores plus the sha256 of the Q&A set,
+# so the payload size does not depend on the number of questions; 'full' pushes every Q&A pair as an Info label.
+def build_qa_metadata_registry(qa_by_instance, registry=None, qa_metadata_export='compact'):
+    from prometheus_client import CollectorRegistry, Gauge, Histogram, Info
+    registry = registry or CollectorRegistry()
     question_count = Gauge('question_count', 'Total number of questions', ['instance'], registry=registry)
     answer_count = Gauge('answer_count', 'Total number of answers', ['instance'], registry=registry)
     longest_answer_length = Gauge('longest_answer_length', 'Length of the longest answer', ['instance'], registry=registry)
     shortest_answer_length = Gauge('shortest_answer_length', 'Length of the shortest answer', ['instance'], registry=registry)
-    
-    question_count.labels(instance=instance).set(len(seed_examples))
-    answer_lengths = [len(example['answer'].split()) for example in seed_examples]
-    answer_count.labels(instance=instance).set(len(answer_lengths))
-    
-    if answer_lengths:
-        longest_answer_length.labels(instance=instance).set(max(answer_lengths))
-        shortest_answer_length.labels(instance=instance).set(min(answer_lengths))
-    
-    qa_info = Info('qa_pairs', 'Question and Answer pairs', registry=registry)
-    qa_info.info({f'qa_pair_{i}': f"Q: {example['question']} A: {example['answer']}" for i, example in enumerate(seed_examples)})
+    if qa_metadata_export == 'full':
+        qa_info = Info('qa_pairs', 'Question and Answer pairs', ['instance'], registry=registry)
+    else:
+        answer_length_histogram = Histogram('answer_length_words', 'Length of the answers in words', ['instance'], buckets=ANSWER_LENGTH_BUCKETS, registry=registry)
+        answer_score_histogram = Histogram('answer_score', 'Similarity score of the answers', ['instance'], buckets=ANSWER_SCORE_BUCKETS, registry=registry)
+        qa_set_info = Info('qa_set', 'Content hash of the Question and Answer set', ['instance'], registry=registry)
 
-    data = generate_latest(registry)
-    
+    for instance, rows in qa_by_instance.items():
+        question_count.labels(instance=instance).set(len(rows))
+        answer_lengths = [len(row['answer'].split()) for row in rows]
+        answer_count.labels(instance=instance).set(len(answer_lengths))
+        if answer_lengths:
+            longest_answer_length.labels(instance=instance).set(max(answer_lengths))
+            shortest_answer_length.labels(instance=instance).set(min(answer_lengths))
+        if qa_metadata_export == 'full':
+            qa_info.labels(instance=instance).info({f'qa_pair_{i}': f"Q: {row['question']} A: {row['answer']}" for i, row in enumerate(rows)})
+            continue
+        for answer_length in answer_lengths:
+            answer_length_histogram.labels(instance=instance).observe(answer_length)
+        for row in rows:
+            if row.get('score') is not None:
+                answer_score_histogram.labels(instance=instance).observe(row['score'])
+        qa_set_info.labels(instance=instance).info({'sha256': json_key(rows)})
+    return registry
+
+# Function to push metrics to Prometheus Pushgateway with optional authentication; the push is sent in the background
+def push_metrics_to_gateway(metrics, job_name, pushgateway_url, instance, username=None, password=None, **exporter_options):
+    from prometheus_client import generate_latest
+    from pushgateway import get_exporter
+    data = generate_latest(build_metrics_registry({instance: metrics}))
     sanitized_instance = instance.replace("/", "-")
-    full_url = f"{pushgateway_url}/metrics/job/{job_name}/instance/{sanitized_instance}"
-    
-    if username and password:
-        response = requests.post(full_url, data=data, auth=HTTPBasicAuth(username, password))
-    else:
-        response = requests.post(full_url, data=data)
-    
-    if response.status_code != 200:
-        logging.error(f"Failed to push Q&A metadata to Pushgateway. URL: {full_url}, Status Code: {response.status_code}, Response: {response.text}")
-    else:
-        logging.info(f"Q&A metadata successfully pushed to Pushgateway. URL: {full_url}")
+    get_exporter(pushgateway_url, username, password, **exporter_options).submit(f"job/{job_name}/instance/{sanitized_instance}", data, 'Metrics')
+
+# Function to push Q&A metadata to Prometheus Pushgateway with optional authentication; the push is sent in the background.
+# seed_examples may be the Q&A pairs or the rows of qa_set_rows(), which also carry the answer scores.
+def push_qa_metadata_to_gateway(seed_examples, job_name, pushgateway_url, instance, username=None, password=None, qa_metadata_export='compact', **exporter_options):
+    from prometheus_client import generate_latest
+    from pushgateway import get_exporter
+    data = generate_latest(build_qa_metadata_registry({instance: seed_examples}, qa_metadata_export=qa_metadata_export))
+    sanitized_instance = instance.replace("/", "-")
+    get_exporter(pushgateway_url, username, password, **exporter_options).submit(f"job/{job_name}/instance/{sanitized_instance}", data, 'Q&A metadata')
+
+# Function to push the metrics and Q&A metadata of every model of a run in a single push, labelled by instance
+def push_run_to_gateway(push_batch, job_name, pushgateway_url, username=None, password=None, qa_metadata_export='compact', **exporter_options):
+    from prometheus_client import generate_latest
+    from pushgateway import get_exporter
+    registry = build_metrics_registry({instance: metrics for instance, (metrics, _) in push_batch.items()})
+    build_qa_metadata_registry({instance: rows for instance, (_, rows) in push_batch.items()}, registry, qa_metadata_export)
+    get_exporter(pushgateway_url, username, password, **exporter_options).submit(f"job/{job_name}", generate_latest(registry), f"Metrics and Q&A metadata of {len(push_batch)} models")
 
 # Function to save Q&A pairs to a YAML file
-def save_qna_to_yaml(seed_examples, model_name):
-    yaml_path = f'{model_name.replace("/", "_")}-qna.yml'
+def save_qna_to_yaml(seed_examples, model_name, output_dir='.'):
+    yaml_path = os.path.join(output_dir, f'{model_name.replace("/", "_")}-qna.yml')
     with open(yaml_path, 'w') as file:
         yaml.dump(seed_examples, file, default_flow_style=False)
     logging.info(f"Q&A pairs saved to {yaml_path}")
 
+# Function to build the tokenized context corpus once so it can be shared by every model.
+# Files are streamed one at a time through read -> line cap -> paragraphs -> keyword filter,
+# and the relevant sections are then split into sentences that remember their file and line.
+# With a stage_cache, the sections and sentences are checkpointed under their inputs and the resolved commit.
+def build_corpus(repo_url, commit_id, patterns, max_files, max_lines, keywords, cache_dir=None, keyword_word_boundary=False, keyword_stemming=False, min_density=0.0, segment_workers=1, incremental=False, max_file_bytes=DEFAULT_MAX_FILE_BYTES, read_workers=1, stage_cache=None):
+    metrics = {}
+    context_sentences = []
+    context_sources = []
+    matcher = KeywordMatcher(keywords, keyword_word_boundary, keyword_stemming)
+
+    # The per-file sections of the previous run are only valid for the same files, caps and keywords
+    state_dir = None
+    previous = None
+    if incremental and cache_dir:
+        state_dir = incremental_state_dir(cache_dir, repo_url, patterns, max_files, max_lines, keywords, keyword_word_boundary, keyword_stemming, max_file_bytes)
+        previous = load_state(os.path.join(state_dir, 'corpus.json'))
+    elif incremental:
+        logging.warning("Incremental regeneration needs a cache_dir, running a full build")
+
+    logging.info(f"Fetching repository {repo_url}")
+    with span('corpus', repo_url=repo_url) as corpus_span, ExitStack() as io_slot:
+        # The I/O slot is only held while the repository is fetched and read, segmentation is CPU work
+        io_slot.enter_context(stage_limit('io'))
+        changed = None
+        mirror = None
+        if state_dir or stage_cache is not None:
+            # Checkpoints and incremental state are tied to the commit a branch or tag resolves to
+            with span('mirror'):
+                mirror, commit_id = update_mirror(repo_url, commit_id, cache_dir)
+                if previous:
+                    changed = changed_paths(mirror, previous['commit'], commit_id)
+                    metrics['incremental_base_commit'] = previous['commit']
+
+        records = None
+        sections_key = None
+        if stage_cache is not None:
+            sections_key = stage_cache.key('sections', repo_url, commit_id, patterns, max_files, max_lines, max_file_bytes, keywords, keyword_word_boundary, keyword_stemming)
+            records = stage_cache.get('sections', sections_key)
+            metrics['sections_checkpoint'] = records is not None
+
+        path_matcher = compile_patterns(patterns)
+        if records is not None:
+            logging.info(f"Reusing the checkpointed sections of {repo_url} at {commit_id}")
+            records = [tuple(item) for item in records]
+            metrics['clone_time'] = corpus_span.child_duration('mirror')
+        elif changed is not None and not any(path_matcher.fullmatch(path) for path in changed):
+            # Nothing the patterns select changed, so the previous sections are the corpus and no checkout is needed
+            logging.info(f"No matching file changed since {previous['commit']}, reusing the previous corpus")
+            records = [tuple(item) for item in previous['files']]
+            metrics['clone_time'] = corpus_span.child_duration('mirror')
+            metrics['changed_file_count'] = 0
+        else:
+            with checkout_repo(repo_url, commit_id, patterns, cache_dir, mirror) as (repo_dir, _):
+                # The fetch and the checkout are timed by their spans, whether the mirror was fetched above or by checkout_repo
+                metrics['clone_time'] = corpus_span.child_duration('mirror') + corpus_span.child_duration('checkout')
+                previous_records = {}
+                if changed is not None:
+                    previous_records = {path: record for path, record in previous['files'] if path not in changed}
+                    metrics['changed_file_count'] = sum(1 for path in changed if path_matcher.fullmatch(path))
+                files = traced(read_git_repo(repo_dir, patterns, max_files, previous_records, max_file_bytes, read_workers), 'read', 'files')
+                records = list(traced(iter_file_records(repo_dir, files, max_lines, matcher, previous_records, max_file_bytes), 'extract', 'files'))
+        metrics['file_read_time'] = corpus_span.child_duration('discover') + corpus_span.child_duration('read')
+        metrics['section_extraction_time'] = corpus_span.child_duration('extract')
+        if state_dir:
+            metrics['reused_file_count'] = sum(1 for path, record in records if changed is not None and path not in changed)
+
+        if state_dir:
+            save_state(os.path.join(state_dir, 'corpus.json'), {'commit': commit_id, 'files': records})
+        if sections_key and not metrics['sections_checkpoint']:
+            stage_cache.put('sections', sections_key, records)
+        io_slot.close()
+
+        sections = [(file_path, line_number, section, Counter(hits)) for file_path, record in records for line_number, section, hits in record['sections']]
+        metrics['file_count'] = len(records)
+        metrics['relevant_section_count'] = len(sections)
+        if min_density > 0:
+            # Sections that only mention a keyword in passing would dilute the corpus the answers are searched in
+            sections = filter_sections_by_density(sections, min_density)
+            metrics['dense_section_count'] = len(sections)
+        sections = [(file_path, line_number, section) for file_path, line_number, section, _ in sections]
+
+        sentences_key = None
+        checkpoint = None
+        if sections_key:
+            sentences_key = stage_cache.key('sentences', sections_key, min_density)
+            checkpoint = stage_cache.get('sentences', sentences_key)
+            metrics['sentences_checkpoint'] = checkpoint is not None
+
+        if checkpoint is not None:
+            context_sentences, context_sources = checkpoint['sentences'], checkpoint['sources']
+        else:
+            # Each section is segmented on its own, so every sentence keeps the file and line it came from
+            with span('tokenize') as tokenize_span:
+                segment_cache = SegmentCache(cache_dir) if cache_dir else None
+                try:
+                    segment_spans = segment_sections([section for _, _, section in sections], segment_cache, segment_workers)
+                finally:
+                    if segment_cache is not None:
+                        segment_cache.close()
+                for (file_path, line_number, section), section_spans in zip(sections, segment_spans):
+                    for start, end in section_spans:
+                        context_sentences.append(section[start:end])
+                        sentence_line = line_number + section.count('\n', 0, start)
+                        context_sources.append(f"{file_path}:{sentence_line}")
+                tokenize_span.count('sections', len(sections))
+                tokenize_span.count('sentences', len(context_sentences))
+            metrics['tokenization_time'] = tokenize_span.duration
+            if segment_cache is not None:
+                metrics['segment_cache_hits'] = segment_cache.hits
+                metrics['segment_cache_misses'] = segment_cache.misses
+            if sentences_key:
+                stage_cache.put('sentences', sentences_key, {'sentences': context_sentences, 'sources': context_sources})
+
+        corpus_span.count('files', len(records))
+        corpus_span.count('sentences', len(context_sentences))
+    metrics['sentence_count'] = len(context_sentences)
+    logging.info(f"Extracted {metrics['relevant_section_count']} relevant sections")
+
+    return {'sentences': context_sentences, 'sources': context_sources, 'metrics': metrics, 'state_dir': state_dir, 'key': sentences_key}
+
 # Function to generate the YAML file
-def generate_yaml(repo_url, commit_id, patterns, yaml_path, project_name, questions, max_files, max_lines, keywords, min_sentence_length, min_answers, taxonomy_dir, model_name, save_scores, pushgateway_url, enable_prometheus, username, password, job_name):
+def generate_yaml(repo_url, commit_id, patterns, yaml_path, project_name, questions, max_files, max_lines, keywords, min_sentence_length, min_answers, taxonomy_dir, model_name, save_scores, pushgateway_url, enable_prometheus, username, password, job_name, cache_dir=None, embedding_cache_max_mb=1024, max_resident_models=2, corpus=None, output_dir='.', keyword_word_boundary=False, keyword_stemming=False, min_density=0.0, top_k=1, score_threshold=None, vector_index='exact', vector_index_params=None, vector_index_recall=False, segment_workers=1, incremental=False, push_batch=None, qa_metadata_export='compact', max_file_bytes=DEFAULT_MAX_FILE_BYTES, read_workers=1, stage_cache=None):
     logging.info(f"Starting YAML generation process with model: {model_name}")
     
     metrics = {
@@ -211,33 +721,102 @@ def generate_yaml(repo_url, commit_id, patterns, yaml_path, project_name, questi
         'start_time': time.time(),
     }
 
-    repo_content, clone_time, file_count = read_git_repo(repo_url, commit_id, patterns, max_files)
-    metrics.update({
-        'clone_time': clone_time,
-        'file_count': file_count,
-    })
-    
-    combined_content = ""
+    if corpus is None:
+        corpus = build_corpus(repo_url, commit_id, patterns, max_files, max_lines, keywords, cache_dir, keyword_word_boundary, keyword_stemming, min_density, segment_workers, incremental, max_file_bytes, read_workers, stage_cache)
+    metrics.update(corpus['metrics'])
 
-    start_time = time.time()
-    for file_path, file_content in repo_content.items():
-        lines = file_content.split('\n')
-        combined_content += "\n".join(lines[:max_lines]) + "\n"
-        if len(combined_content.split('\n')) >= max_lines:
-            break
-    metrics['file_read_time'] = time.time() - start_time
+    # In incremental mode the previous answers of this model are reused when the corpus cannot hold a better one
+    answers_path = None
+    if corpus.get('state_dir'):
+        answers_path = os.path.join(corpus['state_dir'], f'answers_{model_name.replace("/", "_")}.json')
+        answer_settings = json.loads(json.dumps({
+            'project_name': project_name,
+            'questions': questions,
+            'min_sentence_length': min_sentence_length,
+            'top_k': top_k,
+            'score_threshold': score_threshold,
+            'vector_index': vector_index,
+            'vector_index_params': vector_index_params,
+        }))
+        sentence_keys = [content_key(sentence.strip()) for sentence in corpus['sentences']]
+        previous_answers = load_state(answers_path)
+    metrics['answers_reused'] = previous_answers_valid(previous_answers, answer_settings, sentence_keys) if answers_path else False
 
-    start_time = time.time()
-    relevant_sections = extract_relevant_sections(combined_content, keywords)
-    metrics['section_extraction_time'] = time.time() - start_time
-    metrics['relevant_section_count'] = len(relevant_sections)
+    if metrics['answers_reused']:
+        logging.info(f"No answer candidate of {model_name} changed since the previous run, reusing its answers")
+        seed_examples, scores, candidates = restore_answers(previous_answers, sentence_keys, corpus.get('sources'))
+    else:
+        question_texts = [question_template.format(project_name=project_name) for question_template in questions]
 
-    combined_sections = combine_relevant_sections(relevant_sections)
+        # Rankings are checkpointed per question, so new questions are the only ones embedded and searched again
+        # and a change of the answer selection alone reuses every ranking without loading the model
+        ranking_key = None
+        rankings = {}
+        if stage_cache is not None and corpus.get('key'):
+            ranking_key = stage_cache.key('ranking', corpus['key'], model_name, vector_index, vector_index_params, top_k, score_threshold)
+            rankings = stage_cache.get('ranking', ranking_key) or {}
+        missing = [question for question in dict.fromkeys(question_texts) if question not in rankings]
+        metrics['ranked_questions_reused'] = len(question_texts) - len(missing)
 
-    start_time = time.time()
-    seed_examples, scores = generate_qa_pairs(combined_sections, project_name, questions, min_sentence_length, model_name)
-    metrics['qa_generation_time'] = time.time() - start_time
+        if missing:
+            embedding_cache = None
+            if cache_dir:
+                embedding_cache = EmbeddingCache(cache_dir, model_name, max_bytes=embedding_cache_max_mb * 1024 * 1024)
+
+            try:
+                with stage_limit('cpu'):
+                    with span('model_load'):
+                        model, metrics['model_load_time'] = load_model(model_name, max_resident_models)
+                    with span('index', kind=vector_index) as index_span:
+                        index_dir = os.path.join(embedding_cache.shard_dir, 'indexes') if embedding_cache is not None else None
+                        context_index, metrics['vector_index_loaded'], context_embeddings = prepare_context_index(corpus['sentences'], model, embedding_cache, vector_index, vector_index_params, index_dir)
+                    metrics['vector_index'] = vector_index
+                    metrics['vector_index_time'] = index_span.duration
+                    if vector_index == 'exact' or not vector_index_recall:
+                        # Only the recall check needs the raw embeddings once the index is built
+                        context_embeddings = None
+                    # Sentences embedded per second, embedding cache hits included; unknown when a persisted index was loaded
+                    encode_time = index_span.child_duration('encode')
+                    if encode_time > 0:
+                        metrics['encode_sentences_per_s'] = len(corpus['sentences']) / encode_time
+                    with span('score') as score_span:
+                        rankings.update(zip(missing, rank_questions(missing, model, context_index, top_k, score_threshold)))
+                        score_span.count('questions', len(missing))
+                    metrics['qa_generation_time'] = index_span.duration + score_span.duration
+                    if vector_index != 'exact' and vector_index_recall:
+                        with span('recall'):
+                            metrics['vector_index_recall_at_k'] = measure_index_recall(context_index, corpus['sentences'], missing, model, embedding_cache, max(top_k, 10), context_embeddings)
+                        logging.info(f"Recall@{max(top_k, 10)} of the {vector_index} index against exact search: {metrics['vector_index_recall_at_k']:.3f}")
+            finally:
+                if embedding_cache is not None:
+                    embedding_cache.close()
+            if embedding_cache is not None:
+                metrics['embedding_cache_hits'] = embedding_cache.hits
+                metrics['embedding_cache_misses'] = embedding_cache.misses
+            if ranking_key:
+                stage_cache.put('ranking', ranking_key, rankings)
+        else:
+            logging.info(f"Reusing the checkpointed rankings of all {len(question_texts)} questions for {model_name}")
+
+        with span('select'):
+            # Checkpointed rankings come back from JSON as lists
+            ranked = [[(int(index), float(score)) for index, score in rankings[question]] for question in question_texts]
+            seed_examples, scores, candidates = select_answers(corpus['sentences'], question_texts, ranked, min_sentence_length, corpus.get('sources'), score_threshold)
     metrics['qa_count'] = len(seed_examples)
+    metrics['answer_coverage'] = len(seed_examples) / len(questions) if questions else 0.0
+    answer_scores = [row['score'] for row in scores if isinstance(row, dict)]
+    if answer_scores:
+        metrics['mean_score'] = float(np.mean(answer_scores))
+        metrics['min_score'] = float(np.min(answer_scores))
+
+    if answers_path:
+        save_state(answers_path, {
+            'settings': answer_settings,
+            'sentence_keys': sentence_keys,
+            'seed_examples': seed_examples,
+            'scores': scores,
+            'candidates': candidates,
+        })
 
     if not seed_examples:
         scores.append("failed")
@@ -254,35 +833,112 @@ def generate_yaml(repo_url, commit_id, patterns, yaml_path, project_name, questi
         end_color = '\033[0m'
         print(f"{color}Question: {question}\nAnswer: {answer}{end_color}\n")
 
-    if save_scores:
-        save_scores_to_csv(scores, model_name)
+    with span('save'):
+        os.makedirs(output_dir, exist_ok=True)
+        if save_scores:
+            save_scores_to_csv(scores, model_name, output_dir)
+            if top_k > 1:
+                save_candidates_to_csv(candidates, model_name, output_dir)
 
-    save_qna_to_yaml(seed_examples, model_name)
+        save_qna_to_yaml(seed_examples, model_name, output_dir)
+
+    # The compact Q&A metadata export only pushes the hash of the Q&A set, its full text is kept in the artifact store
+    pushing = enable_prometheus and pushgateway_url
+    qa_rows = qa_set_rows(seed_examples, scores)
+    if pushing and qa_metadata_export != 'full' and cache_dir:
+        metrics['qa_set_sha256'] = ArtifactStore(cache_dir).put(qa_rows, project_name=project_name, repo_url=repo_url, commit_id=commit_id, model_name=model_name)
+        logging.info(f"Q&A set of {model_name} stored as artifact {metrics['qa_set_sha256']}")
 
     metrics['end_time'] = time.time()
     metrics['total_time'] = metrics['end_time'] - metrics['start_time']
     
-    metrics_file = f'metrics_{model_name.replace("/", "_")}.csv'
+    metrics_file = os.path.join(output_dir, f'metrics_{model_name.replace("/", "_")}.csv')
     save_metrics_to_csv(metrics, metrics_file)
 
-    if enable_prometheus and pushgateway_url:
-        push_metrics_to_gateway(metrics, job_name=job_name, pushgateway_url=pushgateway_url, instance=model_name, username=username, password=password)
-        push_qa_metadata_to_gateway(seed_examples, job_name=job_name, pushgateway_url=pushgateway_url, instance=model_name, username=username, password=password)
+    if pushing:
+        if push_batch is not None:
+            # run_config pushes every model of the run at once when it is done
+            push_batch[model_name] = (metrics, qa_rows)
+        else:
+            push_metrics_to_gateway(metrics, job_name=job_name, pushgateway_url=pushgateway_url, instance=model_name, username=username, password=password)
+            push_qa_metadata_to_gateway(qa_rows, job_name=job_name, pushgateway_url=pushgateway_url, instance=model_name, username=username, password=password, qa_metadata_export=qa_metadata_export)
 
-# Main script
-if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Generate QnA YAML from a Git repository.")
-    parser.add_argument('--config_path', type=str, default='config.yaml', help='Path to the configuration file')
-    parser.add_argument('--save_scores', action='store_true', help='Flag to save the scores of the models')
-    parser.add_argument('--pushgateway_url', type=str, help='URL of the Prometheus Pushgateway')
-    parser.add_argument('--enable_prometheus', action='store_true', help='Flag to enable Prometheus metrics')
-    parser.add_argument('--username', type=str, help='Username for Prometheus Pushgateway authentication')
-    parser.add_argument('--password', type=str, help='Password for Prometheus Pushgateway authentication')
+    metrics['status'] = 'ok'
+    return metrics
 
-    args = parser.parse_args()
+# Corpus shared by every model a model worker process evaluates, installed once per worker
+_worker_corpus = None
 
-    config = read_config(args.config_path)
+# Environment variables that size the thread pools of OpenMP, MKL, OpenBLAS and the Hugging Face tokenizers
+WORKER_THREAD_VARIABLES = ('OMP_NUM_THREADS', 'MKL_NUM_THREADS', 'OPENBLAS_NUM_THREADS')
+
+# Function to set the thread pool sizes that spawned worker processes inherit, restoring the parent's afterwards.
+# The BLAS libraries read them once when numpy is imported, which happens while a worker unpickles its
+# initializer, so they must already be in the environment the worker starts with.
+@contextmanager
+def worker_thread_env(threads):
+    variables = {variable: str(threads) for variable in WORKER_THREAD_VARIABLES}
+    variables['TOKENIZERS_PARALLELISM'] = 'false'
+    saved = {variable: os.environ.get(variable) for variable in variables}
+    os.environ.update(variables)
+    try:
+        yield
+    finally:
+        for variable, value in saved.items():
+            if value is None:
+                os.environ.pop(variable, None)
+            else:
+                os.environ[variable] = value
+
+# Function to set up a model worker process: keep the shared corpus and pin the torch threads,
+# so the workers of a sweep split the cores between them instead of each using all of them
+def init_model_worker(corpus, threads):
+    global _worker_corpus
+    _worker_corpus = corpus
+    import torch
+    torch.set_num_threads(threads)
 
+# Function to evaluate one model in a model worker, returning its metrics, its trace and its pending Prometheus push
+def evaluate_model(model_name, run_kwargs, profile_stages=None):
+    push_batch = {}
+    # Profiles of concurrent workers are kept apart, each worker numbers its profiles from 1
+    profile_dir = os.path.join(run_kwargs.get('output_dir', '.'), f'profiles_{model_name.replace("/", "_")}')
+    with trace_run('generate', profile_stages, profile_dir, model_name=model_name) as trace:
+        try:
+            result = generate_yaml(model_name=model_name, corpus=_worker_corpus, **dict(run_kwargs, push_batch=push_batch))
+        except Exception as e:
+            logging.error(f"Error with model {model_name}: {e}")
+            result = {'repo_url': run_kwargs['repo_url'], 'commit_id': run_kwargs['commit_id'], 'model_name': model_name, 'status': 'failed', 'error': str(e)}
+    return result, trace.to_dict(), push_batch
+
+# Function to evaluate the models of a sweep concurrently in spawned worker processes over one shared corpus.
+# Every worker gets an equal share of the CPU threads; results keep the order of model_list.
+def evaluate_models_parallel(model_list, corpus, run_kwargs, workers, profile_stages=None, push_batch=None):
+    workers = max(1, min(workers, len(model_list)))
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    logging.info(f"Evaluating {len(model_list)} models with {workers} workers of {threads} threads each")
+    worker_kwargs = {key: value for key, value in run_kwargs.items() if key != 'push_batch'}
+    results = {}
+    # Spawned workers avoid inheriting torch/tokenizer thread state from the parent
+    context = multiprocessing.get_context('spawn')
+    # Workers are started on demand while tasks are submitted, so the environment stays set for the whole pool
+    with worker_thread_env(threads), ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=init_model_worker, initargs=(corpus, threads)) as executor:
+        futures = {executor.submit(evaluate_model, model, worker_kwargs, profile_stages): model for model in model_list}
+        for future in as_completed(futures):
+            model = futures[future]
+            try:
+                results[model], trace, model_push_batch = future.result()
+                attach_trace(trace)
+                if push_batch is not None:
+                    push_batch.update(model_push_batch)
+            except Exception as e:
+                # The worker itself died (e.g. out of memory), record it and keep going
+                logging.error(f"Worker evaluating model {model} crashed: {e}")
+                results[model] = {'repo_url': run_kwargs['repo_url'], 'commit_id': run_kwargs['commit_id'], 'model_name': model, 'status': 'failed', 'error': str(e)}
+    return [results[model] for model in model_list]
+
+# Function to run every model configured in a project configuration, returning one metrics dict per model
+def run_config(config, save_scores=False, pushgateway_url=None, enable_prometheus=False, username=None, password=None, output_dir='.'):
     project_name = config['project_name']
     repo_url = config['repo_url']
     commit_id = config['commit_id']
@@ -296,59 +952,131 @@ if __name__ == "__main__":
     questions = config['questions']
     taxonomy_dir = config['taxonomy_dir']
     model_list = config.get('model_list', [config['model_name']])
-    pushgateway_url = config.get('pushgateway_url', args.pushgateway_url)
-    enable_prometheus = args.enable_prometheus
-    username = args.username
-    password = args.password
+    pushgateway_url = config.get('pushgateway_url', pushgateway_url)
     job_name = project_name
+    cache_dir = config.get('cache_dir', DEFAULT_CACHE_DIR)
+    if cache_dir:
+        cache_dir = os.path.expanduser(cache_dir)
+    embedding_cache_max_mb = config.get('embedding_cache_max_mb', 1024)
+    max_resident_models = config.get('max_resident_models', 2)
+    keyword_word_boundary = config.get('keyword_word_boundary', False)
+    keyword_stemming = config.get('keyword_stemming', False)
+    min_density = config.get('min_keyword_density', 0.0)
+    if 'rank_sections' in config:
+        logging.warning("rank_sections no longer has an effect, answers are picked by similarity whatever the section order; use min_keyword_density to drop sparse sections")
+    top_k = config.get('top_k', 1)
+    score_threshold = config.get('score_threshold')
+    vector_index = config.get('vector_index', 'exact')
+    vector_index_params = config.get('vector_index_params') or {}
+    vector_index_recall = config.get('vector_index_recall', False)
+    segment_workers = config.get('segment_workers', 1)
+    incremental = config.get('incremental', False)
+    exporter_options = {
+        'timeout': config.get('pushgateway_timeout', 10.0),
+        'max_retries': config.get('pushgateway_retries', 5),
+        'queue_size': config.get('pushgateway_queue_size', 100),
+    }
+    qa_metadata_export = config.get('qa_metadata_export', 'compact')
+    model_workers = config.get('model_workers', 1)
+    max_file_bytes = config.get('max_file_bytes', DEFAULT_MAX_FILE_BYTES)
+    read_workers = config.get('read_workers', 4)
+    # Stage checkpoints let a rerun with partly changed settings resume at the first stage whose inputs changed
+    stage_cache = None
+    if cache_dir and config.get('checkpoints', True):
+        stage_cache = StageCache(cache_dir, max_bytes=config.get('checkpoint_max_mb', 512) * 1024 * 1024)
+    push_batch = {}
 
-    if config.get('optimize', False):
-        for model in model_list:
-            logging.info(f"Running optimization with model: {model}")
-            try:
-                generate_yaml(
-                    repo_url=repo_url,
-                    commit_id=commit_id,
-                    patterns=patterns,
-                    yaml_path=yaml_path,
-                    project_name=project_name,
-                    questions=questions,
-                    max_files=max_files,
-                    max_lines=max_lines,
-                    keywords=keywords,
-                    min_sentence_length=min_sentence_length,
-                    min_answers=min_answers,
-                    taxonomy_dir=taxonomy_dir,
-                    model_name=model,
-                    save_scores=args.save_scores,
-                    pushgateway_url=pushgateway_url,
-                    enable_prometheus=enable_prometheus,
-                    username=username,
-                    password=password,
-                    job_name=job_name
-                )
-            except Exception as e:
-                logging.error(f"Error with model {model}: {e}")
-                continue
-    else:
-        generate_yaml(
-            repo_url=repo_url,
-            commit_id=commit_id,
-            patterns=patterns,
-            yaml_path=yaml_path,
-            project_name=project_name,
-            questions=questions,
-            max_files=max_files,
-            max_lines=max_lines,
-            keywords=keywords,
-            min_sentence_length=min_sentence_length,
-            min_answers=min_answers,
-            taxonomy_dir=taxonomy_dir,
-            model_name=model_list[0],
-            save_scores=args.save_scores,
-            pushgateway_url=pushgateway_url,
-            enable_prometheus=enable_prometheus,
-            username=username,
-            password=password,
-            job_name=job_name
-        )
+    run_kwargs = dict(
+        repo_url=repo_url,
+        commit_id=commit_id,
+        patterns=patterns,
+        yaml_path=yaml_path,
+        project_name=project_name,
+        questions=questions,
+        max_files=max_files,
+        max_lines=max_lines,
+        keywords=keywords,
+        min_sentence_length=min_sentence_length,
+        min_answers=min_answers,
+        taxonomy_dir=taxonomy_dir,
+        save_scores=save_scores,
+        pushgateway_url=pushgateway_url,
+        enable_prometheus=enable_prometheus,
+        username=username,
+        password=password,
+        job_name=job_name,
+        cache_dir=cache_dir,
+        embedding_cache_max_mb=embedding_cache_max_mb,
+        max_resident_models=max_resident_models,
+        output_dir=output_dir,
+        keyword_word_boundary=keyword_word_boundary,
+        keyword_stemming=keyword_stemming,
+        min_density=min_density,
+        top_k=top_k,
+        score_threshold=score_threshold,
+        vector_index=vector_index,
+        vector_index_params=vector_index_params,
+        vector_index_recall=vector_index_recall,
+        segment_workers=segment_workers,
+        incremental=incremental,
+        push_batch=push_batch,
+        qa_metadata_export=qa_metadata_export,
+        max_file_bytes=max_file_bytes,
+        read_workers=read_workers,
+        stage_cache=stage_cache
+    )
+
+    # One trace per run, written next to the outputs even when the run fails
+    status = 'failed'
+    try:
+        with trace_run(project_name, config.get('profile_stages'), output_dir, commit_id=commit_id) as trace:
+            if not config.get('optimize', False):
+                with span('generate', model_name=model_list[0]):
+                    results = [generate_yaml(model_name=model_list[0], **run_kwargs)]
+            else:
+                # Clone, read, extract and tokenize once, then fan the corpus out to every model
+                corpus = build_corpus(repo_url, commit_id, patterns, max_files, max_lines, keywords, cache_dir, keyword_word_boundary, keyword_stemming, min_density, segment_workers, incremental, max_file_bytes, read_workers, stage_cache)
+                if model_workers > 1 and len(model_list) > 1:
+                    results = evaluate_models_parallel(model_list, corpus, run_kwargs, model_workers, config.get('profile_stages'), push_batch)
+                else:
+                    results = []
+                    for model in model_list:
+                        logging.info(f"Running optimization with model: {model}")
+                        try:
+                            with span('generate', model_name=model):
+                                results.append(generate_yaml(model_name=model, corpus=corpus, **run_kwargs))
+                        except Exception as e:
+                            logging.error(f"Error with model {model}: {e}")
+                            results.append({'repo_url': repo_url, 'commit_id': commit_id, 'model_name': model, 'status': 'failed', 'error': str(e)})
+                            continue
+                save_leaderboard(results, output_dir)
+            if push_batch:
+                push_run_to_gateway(push_batch, job_name, pushgateway_url, username, password, qa_metadata_export, **exporter_options)
+        status = 'ok'
+    finally:
+        trace.attributes['status'] = status
+        save_trace(trace, os.path.join(output_dir, 'trace.json'))
+    return results
+
+# Main script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate QnA YAML from a Git repository.")
+    parser.add_argument('--config_path', type=str, default='config.yaml', help='Path to the configuration file')
+    parser.add_argument('--save_scores', action='store_true', help='Flag to save the scores of the models')
+    parser.add_argument('--pushgateway_url', type=str, help='URL of the Prometheus Pushgateway')
+    parser.add_argument('--enable_prometheus', action='store_true', help='Flag to enable Prometheus metrics')
+    parser.add_argument('--username', type=str, help='Username for Prometheus Pushgateway authentication')
+    parser.add_argument('--password', type=str, help='Password for Prometheus Pushgateway authentication')
+
+    args = parser.parse_args()
+
+    config = read_config(args.config_path)
+
+    run_config(
+        config,
+        save_scores=args.save_scores,
+        pushgateway_url=args.pushgateway_url,
+        enable_prometheus=args.enable_prometheus,
+        username=args.username,
+        password=args.password
+    )
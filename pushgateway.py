@@ -0,0 +1,130 @@
+import atexit
+import queue
+import random
+import logging
+import threading
+import multiprocessing.util
+import requests
+from requests.adapters import HTTPAdapter
+from requests.auth import HTTPBasicAuth
+
+# Pushes waiting for the background thread; when full the oldest push is dropped so the freshest metrics win
+DEFAULT_QUEUE_SIZE = 100
+
+# Shared exporters of this process, one per gateway and credentials
+_exporters = {}
+_exporters_lock = threading.Lock()
+
+# Background sender of Pushgateway payloads. Pushes are queued and sent by one daemon thread over a pooled
+# requests.Session with connect/read timeouts, retrying connection errors, 429 and 5xx responses with
+# exponential backoff and jitter, so a slow or unavailable gateway never blocks QnA generation.
+class PushgatewayExporter:
+    def __init__(self, pushgateway_url, username=None, password=None, timeout=10.0, max_retries=5, backoff=0.5, max_backoff=30.0, queue_size=DEFAULT_QUEUE_SIZE):
+        self.pushgateway_url = pushgateway_url.rstrip('/')
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.sent = 0
+        self.failed = 0
+        self.dropped = 0
+
+        self.session = requests.Session()
+        self.session.mount('http://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        self.session.mount('https://', HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        if username and password:
+            self.session.auth = HTTPBasicAuth(username, password)
+
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self._run, name='pushgateway-exporter', daemon=True)
+        self.thread.start()
+
+    # Queue a payload for the grouping path, e.g. 'job/<job>' or 'job/<job>/instance/<instance>'
+    def submit(self, grouping, data, description='metrics'):
+        item = (f"{self.pushgateway_url}/metrics/{grouping}", data, description)
+        while True:
+            try:
+                self.queue.put_nowait(item)
+                return
+            except queue.Full:
+                try:
+                    _, _, dropped_description = self.queue.get_nowait()
+                    self.queue.task_done()
+                    self.dropped += 1
+                    logging.warning(f"Pushgateway queue is full, dropped the oldest push ({dropped_description})")
+                except queue.Empty:
+                    pass
+
+    # Send one payload, retrying transient failures; returns whether the gateway accepted it
+    def _send(self, url, data, description):
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self.session.post(url, data=data, timeout=self.timeout)
+                if response.status_code < 300:
+                    logging.info(f"{description} successfully pushed to Pushgateway. URL: {url}")
+                    return True
+                message = f"Status Code: {response.status_code}, Response: {response.text}"
+                if response.status_code < 500 and response.status_code != 429:
+                    # The gateway rejected the payload, sending it again cannot succeed
+                    logging.error(f"Failed to push {description} to Pushgateway. URL: {url}, {message}")
+                    return False
+            except requests.RequestException as e:
+                message = str(e)
+            if attempt < self.max_retries:
+                delay = min(self.max_backoff, self.backoff * 2 ** attempt) * random.uniform(0.5, 1.0)
+                logging.warning(f"Push of {description} to {url} failed ({message}), retrying in {delay:.1f} seconds")
+                # Closing the exporter cuts the backoff short so shutdown is bounded by the close timeout
+                if self.closed.wait(delay):
+                    break
+        logging.error(f"Giving up pushing {description} to Pushgateway. URL: {url}, {message}")
+        return False
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is None:
+                    return
+                if self._send(*item):
+                    self.sent += 1
+                else:
+                    self.failed += 1
+            finally:
+                self.queue.task_done()
+
+    # Wait for the queued pushes to be sent, for at most timeout seconds, then stop the background thread
+    def close(self, timeout=30.0):
+        if not self.thread.is_alive():
+            return
+        try:
+            self.queue.put(None, timeout=timeout)
+            self.thread.join(timeout)
+        except queue.Full:
+            pass
+        if self.thread.is_alive():
+            self.closed.set()
+            self.thread.join(min(timeout, self.timeout))
+            logging.warning(f"Pushgateway exporter stopped with {self.queue.qsize()} pushes still queued")
+        self.session.close()
+        logging.info(f"Pushgateway exporter finished: {self.sent} sent, {self.failed} failed, {self.dropped} dropped")
+
+# Function to return the shared exporter of this process for a gateway, creating it on first use
+def get_exporter(pushgateway_url, username=None, password=None, **options):
+    key = (pushgateway_url, username, password)
+    with _exporters_lock:
+        if key not in _exporters:
+            _exporters[key] = PushgatewayExporter(pushgateway_url, username, password, **options)
+        return _exporters[key]
+
+# Function to flush and stop every shared exporter, registered to run when the process exits.
+# Worker processes of a pool skip atexit handlers but run multiprocessing finalizers, so both are registered.
+def close_exporters(timeout=30.0):
+    with _exporters_lock:
+        exporters = list(_exporters.values())
+        _exporters.clear()
+    for exporter in exporters:
+        exporter.close(timeout)
+
+atexit.register(close_exporters)
+multiprocessing.util.Finalize(None, close_exporters, exitpriority=10)
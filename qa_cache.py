@@ -0,0 +1,374 @@
+import os
+import gzip
+import hashlib
+import json
+import logging
+import sqlite3
+import time
+import uuid
+import numpy as np
+
+# Default root directory for all on-disk caches
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "instructlab-qa-generator")
+
+# SQLite limits the number of host parameters per statement, so lookups are chunked
+SQLITE_BATCH_SIZE = 500
+
+# Shards smaller than this are merged into shards of about this size once a model has COMPACT_MIN_SHARDS of them,
+# so runs that only encode a handful of new sentences do not leave thousands of tiny files behind
+SHARD_TARGET_BYTES = 4 * 1024 * 1024
+COMPACT_MIN_SHARDS = 16
+
+# Function to compute the content hash used as a cache key
+def content_key(text):
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+# Function to serialize content as canonical JSON, so equal content always has the same hash
+def canonical_json(content):
+    return json.dumps(content, sort_keys=True, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+
+# Function to compute the content hash of JSON-serializable content
+def json_key(content):
+    return hashlib.sha256(canonical_json(content)).hexdigest()
+
+# Function to turn a model name into a safe directory name
+def sanitize_name(name):
+    return name.replace("/", "_")
+
+# Content-addressed store of sentence embeddings.
+# Vectors are kept in immutable float32 .npy shards that are memory-mapped on read,
+# and a SQLite index maps (model_name, sha256 of sentence) to (shard, row).
+# Small shards are merged into larger ones, and whole shards are evicted least-recently-used first
+# once the store exceeds max_bytes.
+class EmbeddingCache:
+    def __init__(self, cache_dir, model_name, max_bytes=1024 * 1024 * 1024):
+        self.root = os.path.join(cache_dir, 'embeddings')
+        self.shard_dir = os.path.join(self.root, sanitize_name(model_name))
+        os.makedirs(self.shard_dir, exist_ok=True)
+        self.model_name = model_name
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(os.path.join(self.root, 'index.sqlite'), timeout=60)
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS entries (model TEXT, key TEXT, shard TEXT, row INTEGER, PRIMARY KEY (model, key))")
+            self.db.execute("CREATE TABLE IF NOT EXISTS shards (shard TEXT PRIMARY KEY, model TEXT, nbytes INTEGER, last_used REAL)")
+
+    def close(self):
+        self.db.close()
+
+    # Look up the shard location of each key that is cached for this model
+    def _lookup(self, keys):
+        locations = {}
+        keys = list(keys)
+        for i in range(0, len(keys), SQLITE_BATCH_SIZE):
+            batch = keys[i:i + SQLITE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            rows = self.db.execute(
+                f"SELECT key, shard, row FROM entries WHERE model = ? AND key IN ({placeholders})",
+                [self.model_name, *batch]
+            )
+            for key, shard, row in rows:
+                locations[key] = (shard, row)
+        return locations
+
+    # Write newly encoded vectors as a new shard and register them in the index
+    def _write_shard(self, keys, vectors):
+        shard = f"{uuid.uuid4().hex}.npy"
+        path = os.path.join(self.shard_dir, shard)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, 'wb') as file:
+            np.save(file, vectors)
+        os.replace(tmp_path, path)
+        with self.db:
+            self.db.execute(
+                "INSERT OR REPLACE INTO shards (shard, model, nbytes, last_used) VALUES (?, ?, ?, ?)",
+                (shard, self.model_name, os.path.getsize(path), time.time())
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO entries (model, key, shard, row) VALUES (?, ?, ?, ?)",
+                [(self.model_name, key, shard, row) for row, key in enumerate(keys)]
+            )
+        return {key: (shard, row) for row, key in enumerate(keys)}
+
+    # Drop index entries whose shard file has disappeared (e.g. evicted by another process)
+    def _forget_shard(self, shard):
+        with self.db:
+            self.db.execute("DELETE FROM entries WHERE shard = ?", (shard,))
+            self.db.execute("DELETE FROM shards WHERE shard = ?", (shard,))
+
+    # Read the rows for the given locations, grouped by shard
+    def _gather(self, locations):
+        vectors = {}
+        by_shard = {}
+        for key, (shard, row) in locations.items():
+            by_shard.setdefault(shard, []).append((key, row))
+        for shard, entries in by_shard.items():
+            path = os.path.join(self.shard_dir, shard)
+            try:
+                data = np.load(path, mmap_mode='r')
+            except FileNotFoundError:
+                logging.warning(f"Embedding shard {shard} is missing, re-encoding its sentences")
+                self._forget_shard(shard)
+                continue
+            rows = np.asarray(data[[row for _, row in entries]], dtype=np.float32)
+            for (key, _), vector in zip(entries, rows):
+                vectors[key] = vector
+        if by_shard:
+            now = time.time()
+            with self.db:
+                self.db.executemany("UPDATE shards SET last_used = ? WHERE shard = ?", [(now, shard) for shard in by_shard])
+        return vectors
+
+    # Account files stored next to the shards of this model, such as persisted vector indexes, as shards:
+    # they count towards max_bytes, are marked as used now and are evicted least-recently-used with the shards
+    def track_files(self, paths):
+        now = time.time()
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO shards (shard, model, nbytes, last_used) VALUES (?, ?, ?, ?)",
+                [(os.path.relpath(path, self.shard_dir), self.model_name, os.path.getsize(path), now) for path in paths]
+            )
+        self._evict()
+
+    # Merge the small shards of this model, least recently used first, into shards of about SHARD_TARGET_BYTES
+    def _compact(self):
+        small = self.db.execute(
+            "SELECT shard, nbytes FROM shards WHERE model = ? AND shard NOT LIKE '%/%' AND nbytes < ? ORDER BY last_used",
+            (self.model_name, SHARD_TARGET_BYTES)
+        ).fetchall()
+        if len(small) < COMPACT_MIN_SHARDS:
+            return
+        group, size = [], 0
+        for shard, nbytes in small:
+            group.append(shard)
+            size += nbytes
+            if size >= SHARD_TARGET_BYTES:
+                self._merge_shards(group)
+                group, size = [], 0
+        if len(group) > 1:
+            self._merge_shards(group)
+
+    # Rewrite the rows of several shards as one new shard and drop the old ones
+    def _merge_shards(self, shards):
+        arrays = {}
+        for shard in shards:
+            try:
+                arrays[shard] = np.load(os.path.join(self.shard_dir, shard))
+            except FileNotFoundError:
+                # Already merged or evicted by another process
+                self._forget_shard(shard)
+        if len(arrays) < 2:
+            return
+        entries = []
+        names = list(arrays)
+        for i in range(0, len(names), SQLITE_BATCH_SIZE):
+            batch = names[i:i + SQLITE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            entries.extend(self.db.execute(f"SELECT key, shard, row FROM entries WHERE model = ? AND shard IN ({placeholders})", [self.model_name, *batch]))
+        if entries:
+            # Re-registering the keys points them at the merged shard
+            self._write_shard([key for key, _, _ in entries], np.stack([arrays[shard][row] for _, shard, row in entries]))
+        for shard in names:
+            self._forget_shard(shard)
+            try:
+                os.remove(os.path.join(self.shard_dir, shard))
+            except FileNotFoundError:
+                pass
+        logging.info(f"Merged {len(names)} embedding shards of {self.model_name} into one of {len(entries)} vectors")
+
+    # Evict least-recently-used shards until the store fits in max_bytes
+    def _evict(self):
+        total = self.db.execute("SELECT COALESCE(SUM(nbytes), 0) FROM shards").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for shard, model, nbytes in self.db.execute("SELECT shard, model, nbytes FROM shards ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            self._forget_shard(shard)
+            try:
+                os.remove(os.path.join(self.root, sanitize_name(model), shard))
+            except FileNotFoundError:
+                pass
+            total -= nbytes
+            logging.info(f"Evicted embedding shard {shard} ({nbytes} bytes)")
+
+    # Encode sentences, only running the model on sentences that are not cached yet
+    def encode(self, model, sentences):
+        keys = [content_key(sentence) for sentence in sentences]
+        unique = dict(zip(keys, sentences))
+        vectors = self._gather(self._lookup(unique))
+
+        missing = [key for key in unique if key not in vectors]
+        self.hits += len(unique) - len(missing)
+        self.misses += len(missing)
+        if missing:
+            encoded = model.encode([unique[key] for key in missing], convert_to_numpy=True)
+            encoded = np.asarray(encoded, dtype=np.float32)
+            self._write_shard(missing, encoded)
+            vectors.update(zip(missing, encoded))
+            self._compact()
+            self._evict()
+
+        logging.info(f"Embedding cache for {self.model_name}: {len(unique) - len(missing)} hits, {len(missing)} misses")
+        if not keys:
+            return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+        return np.stack([vectors[key] for key in keys])
+
+# Cache of sentence segmentations, keyed by the sha256 of a section of text.
+# Each entry stores the (start, end) character spans of the sentences, so unchanged text is never re-tokenized.
+class SegmentCache:
+    def __init__(self, cache_dir):
+        os.makedirs(cache_dir, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self.db = sqlite3.connect(os.path.join(cache_dir, 'segments.sqlite'), timeout=60)
+        with self.db:
+            self.db.execute("CREATE TABLE IF NOT EXISTS segments (key TEXT PRIMARY KEY, spans TEXT)")
+
+    def close(self):
+        self.db.close()
+
+    # Return the cached spans of every key that is present
+    def get_many(self, keys):
+        found = {}
+        keys = list(set(keys))
+        for i in range(0, len(keys), SQLITE_BATCH_SIZE):
+            batch = keys[i:i + SQLITE_BATCH_SIZE]
+            placeholders = ",".join("?" * len(batch))
+            for key, spans in self.db.execute(f"SELECT key, spans FROM segments WHERE key IN ({placeholders})", batch):
+                found[key] = [tuple(span) for span in json.loads(spans)]
+        self.hits += len(found)
+        self.misses += len(keys) - len(found)
+        return found
+
+    # Store the spans of newly segmented sections
+    def put_many(self, items):
+        with self.db:
+            self.db.executemany(
+                "INSERT OR REPLACE INTO segments (key, spans) VALUES (?, ?)",
+                [(key, json.dumps(spans)) for key, spans in items.items()]
+            )
+
+# Function to compute the directory holding the incremental state of one corpus configuration
+def incremental_state_dir(cache_dir, *settings):
+    digest = hashlib.sha256(json.dumps(settings, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+    return os.path.join(cache_dir, 'incremental', digest)
+
+# Function to load a JSON state file, returning None if it is missing or unreadable
+def load_state(path):
+    try:
+        with open(path, 'r') as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError) as e:
+        logging.warning(f"Ignoring unreadable state file {path}: {e}")
+        return None
+
+# Function to write a JSON state file; it is written under a temporary name first so readers never see a partial file
+def save_state(path, state):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    with open(tmp_path, 'w') as file:
+        json.dump(state, file)
+    os.replace(tmp_path, path)
+
+# Append-only store of gzip-compressed JSON artifacts, addressed by the sha256 of their canonical JSON.
+# An artifact is written once and never modified, and index.jsonl records every time one was produced and for what.
+class ArtifactStore:
+    def __init__(self, cache_dir):
+        self.root = os.path.join(cache_dir, 'artifacts')
+        os.makedirs(self.root, exist_ok=True)
+
+    def path(self, digest):
+        return os.path.join(self.root, digest[:2], f"{digest}.json.gz")
+
+    # Store content unless an identical artifact exists, log the context it was produced in and return its hash
+    def put(self, content, **context):
+        data = canonical_json(content)
+        digest = hashlib.sha256(data).hexdigest()
+        path = self.path(digest)
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp{os.getpid()}"
+            with gzip.open(tmp_path, 'wb') as file:
+                file.write(data)
+            os.replace(tmp_path, path)
+        with open(os.path.join(self.root, 'index.jsonl'), 'a') as file:
+            file.write(json.dumps(dict(context, sha256=digest, time=time.time())) + "\n")
+        return digest
+
+    def get(self, digest):
+        with gzip.open(self.path(digest), 'rb') as file:
+            return json.loads(file.read())
+
+# Checkpoints of pipeline stages: the JSON output of a stage, gzip-compressed and stored under the sha256 of the
+# stage inputs, so a rerun resumes at the first stage whose inputs changed.
+# Least recently used checkpoints are evicted once the store exceeds max_bytes.
+class StageCache:
+    def __init__(self, cache_dir, max_bytes=512 * 1024 * 1024):
+        self.root = os.path.join(cache_dir, 'stages')
+        os.makedirs(self.root, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    # Compute the key of a stage output from the stage name and every input it depends on
+    @staticmethod
+    def key(stage, *inputs):
+        return json_key([stage, *inputs])
+
+    def path(self, stage, key):
+        return os.path.join(self.root, stage, f"{key}.json.gz")
+
+    # Return the checkpointed output of a stage, or None
+    def get(self, stage, key):
+        path = self.path(stage, key)
+        try:
+            with gzip.open(path, 'rb') as file:
+                value = json.loads(file.read())
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, EOFError, ValueError) as e:
+            logging.warning(f"Ignoring unreadable checkpoint {path}: {e}")
+            self.misses += 1
+            return None
+        # The modification time marks when a checkpoint was last used
+        os.utime(path)
+        self.hits += 1
+        return value
+
+    # Store the output of a stage; checkpoints are rewritten often, so they are compressed for speed rather than size
+    def put(self, stage, key, value):
+        path = self.path(stage, key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp{os.getpid()}"
+        with gzip.open(tmp_path, 'wb', compresslevel=1) as file:
+            file.write(json.dumps(value).encode('utf-8'))
+        os.replace(tmp_path, path)
+        self._evict()
+
+    # Evict least-recently-used checkpoints until the store fits in max_bytes
+    def _evict(self):
+        entries = []
+        for dir_path, _, names in os.walk(self.root):
+            for name in names:
+                if name.endswith('.json.gz'):
+                    path = os.path.join(dir_path, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            logging.info(f"Evicted checkpoint {path} ({size} bytes)")
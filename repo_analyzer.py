@@ -0,0 +1,184 @@
+import os
+import re
+import math
+import logging
+import multiprocessing
+from itertools import repeat
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from file_discovery import is_binary_file, discover_files
+
+# Documentation files, whose words are ranked as keywords: READMEs, markup files and everything under a docs directory
+DOC_EXTENSIONS = {'.md', '.markdown', '.rst'}
+DOC_DIRS = {'doc', 'docs'}
+
+# Words of at least three letters or digits, starting with a letter
+WORD_PATTERN = re.compile(r'[a-z][a-z0-9]{2,}')
+
+# Bytes read at a time while counting the lines of a file, and the size of the blocks of whole lines tokenized at once
+READ_CHUNK_BYTES = 1024 * 1024
+TOKENIZE_BLOCK_BYTES = 64 * 1024
+
+# Files handed to a worker per task
+ANALYSIS_TASK_FILES = 256
+
+# Repositories with fewer files are analyzed inline, starting worker processes would take longer than reading them
+ANALYSIS_POOL_MIN_FILES = 2000
+
+# Bounds of the suggested max_files and max_lines, and the steps they are rounded up to
+SUGGESTED_FILES_RANGE = (100, 5000, 50)
+SUGGESTED_LINES_RANGE = (2000, 200000, 1000)
+
+# Stopwords of the worker processes, installed once per worker
+_stop_words = frozenset()
+
+# Function to install the stopwords in a worker process
+def init_analysis_worker(stop_words):
+    global _stop_words
+    _stop_words = frozenset(stop_words)
+
+# Function to decide whether a file is documentation
+def is_doc_file(rel_path):
+    parts = rel_path.lower().split('/')
+    name = parts[-1]
+    return name.startswith('readme') or os.path.splitext(name)[1] in DOC_EXTENSIONS or any(part in DOC_DIRS for part in parts[:-1])
+
+# Function to count the lines of a file without holding more than one chunk of it in memory
+def count_lines(path):
+    lines = 0
+    last = b'\n'
+    with open(path, 'rb') as file:
+        while True:
+            chunk = file.read(READ_CHUNK_BYTES)
+            if not chunk:
+                break
+            lines += chunk.count(b'\n')
+            last = chunk[-1:]
+    # A last line without a newline still counts
+    return lines + (last != b'\n')
+
+# Function to analyze one file: its size and line count and, for documentation, the count of every word.
+# Files are streamed in blocks of whole lines, binary files are only sniffed.
+def analyze_file(base_dir, rel_path, stop_words):
+    path = os.path.join(base_dir, rel_path)
+    stats = {'path': rel_path, 'extension': os.path.splitext(rel_path)[1], 'bytes': 0, 'lines': 0, 'binary': False, 'doc': False}
+    terms = None
+    try:
+        stats['bytes'] = os.path.getsize(path)
+        if is_binary_file(path):
+            stats['binary'] = True
+        elif not is_doc_file(rel_path):
+            stats['lines'] = count_lines(path)
+        else:
+            stats['doc'] = True
+            terms = Counter()
+            with open(path, 'r', encoding='utf-8', errors='ignore') as file:
+                while True:
+                    lines = file.readlines(TOKENIZE_BLOCK_BYTES)
+                    if not lines:
+                        break
+                    stats['lines'] += len(lines)
+                    terms.update(WORD_PATTERN.findall(''.join(lines).lower()))
+            # Dropping the stopwords once per file is cheaper than testing every word
+            for word in stop_words & terms.keys():
+                del terms[word]
+    except OSError as e:
+        logging.warning(f"Skipping unreadable file {rel_path}: {e}")
+        return None, None
+    return stats, terms
+
+# Function to analyze a batch of files, returning their statistics, the term frequencies of its documentation files
+# summed over the documents, the number of documents containing each term and the number of documents
+def analyze_files(base_dir, rel_paths, stop_words=None):
+    stop_words = _stop_words if stop_words is None else stop_words
+    files = []
+    term_frequencies = Counter()
+    document_frequencies = Counter()
+    documents = 0
+    for rel_path in rel_paths:
+        stats, terms = analyze_file(base_dir, rel_path, stop_words)
+        if stats is None:
+            continue
+        files.append(stats)
+        if stats['doc']:
+            documents += 1
+            total = sum(terms.values())
+            for term, count in terms.items():
+                term_frequencies[term] += count / total
+            document_frequencies.update(terms.keys())
+    return files, term_frequencies, document_frequencies, documents
+
+# Function to rank terms by TF-IDF: term frequencies summed over the documents, weighted by the smoothed inverse
+# document frequency, so words found on every page rank below words specific to a part of the project
+def rank_keywords(term_frequencies, document_frequencies, documents, num_keywords=10):
+    scores = {term: frequency * (math.log((1 + documents) / (1 + document_frequencies[term])) + 1) for term, frequency in term_frequencies.items()}
+    return [term for term, _ in sorted(scores.items(), key=lambda item: (-item[1], item[0]))[:num_keywords]]
+
+# Function to summarize the files of every extension: files, text files, bytes and lines (total, median, p90 and max per file)
+def extension_stats(files):
+    by_extension = {}
+    for stats in files:
+        by_extension.setdefault(stats['extension'] or '(none)', []).append(stats)
+    summary = {}
+    for extension, group in by_extension.items():
+        lines = sorted(stats['lines'] for stats in group if not stats['binary'])
+        summary[extension] = {
+            'files': len(group),
+            'text_files': len(lines),
+            'bytes': sum(stats['bytes'] for stats in group),
+            'lines': sum(lines),
+            'median_lines': lines[len(lines) // 2] if lines else 0,
+            'p90_lines': lines[int(0.9 * (len(lines) - 1))] if lines else 0,
+            'max_lines': lines[-1] if lines else 0,
+        }
+    return dict(sorted(summary.items(), key=lambda item: (-item[1]['lines'], item[0])))
+
+# Function to round a value up to a step and keep it within bounds
+def bounded(value, low, high, step):
+    return max(low, min(high, -(-value // step) * step))
+
+# Function to suggest max_files and max_lines that cover the text files of the repository in discovery order
+def suggest_limits(files):
+    text_files = [stats for stats in files if not stats['binary']]
+    max_files = bounded(len(text_files), *SUGGESTED_FILES_RANGE)
+    max_lines = bounded(sum(stats['lines'] for stats in text_files[:max_files]), *SUGGESTED_LINES_RANGE)
+    return max_files, max_lines
+
+# Function to analyze a repository in one pass over its files, spread across worker processes for large repositories.
+# Returns the relative paths, per-extension statistics, TF-IDF keywords and suggested max_files/max_lines.
+def analyze_repository(base_dir, workers=None, stop_words=(), num_keywords=10):
+    rel_paths = [os.path.relpath(path, base_dir).replace(os.sep, '/') for path in discover_files(base_dir, ['**/*'])]
+    tasks = [rel_paths[i:i + ANALYSIS_TASK_FILES] for i in range(0, len(rel_paths), ANALYSIS_TASK_FILES)]
+    workers = max(1, min(workers or os.cpu_count() or 1, os.cpu_count() or 1, len(tasks)))
+
+    files = []
+    term_frequencies = Counter()
+    document_frequencies = Counter()
+    documents = 0
+    executor = None
+    if workers > 1 and len(rel_paths) >= ANALYSIS_POOL_MIN_FILES:
+        logging.info(f"Analyzing {len(rel_paths)} files with {workers} workers")
+        executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'), initializer=init_analysis_worker, initargs=(frozenset(stop_words),))
+        results = executor.map(analyze_files, repeat(base_dir), tasks)
+    else:
+        results = (analyze_files(base_dir, task, frozenset(stop_words)) for task in tasks)
+    try:
+        for task_files, task_term_frequencies, task_document_frequencies, task_documents in results:
+            files.extend(task_files)
+            term_frequencies.update(task_term_frequencies)
+            document_frequencies.update(task_document_frequencies)
+            documents += task_documents
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    max_files, max_lines = suggest_limits(files)
+    logging.info(f"Analyzed {len(files)} files, {documents} of them documentation")
+    return {
+        'paths': [stats['path'] for stats in files],
+        'extensions': extension_stats(files),
+        'documents': documents,
+        'keywords': rank_keywords(term_frequencies, document_frequencies, documents, num_keywords),
+        'max_files': max_files,
+        'max_lines': max_lines,
+    }
@@ -0,0 +1,123 @@
+import os
+import re
+import fcntl
+import hashlib
+import logging
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+import git
+from tracing import span
+
+# Full commit ids can be answered from the mirror without asking the remote
+FULL_SHA_PATTERN = re.compile(r'^[0-9a-f]{40}$')
+
+# Function to compute where the bare mirror of a repository lives
+def mirror_path(cache_dir, repo_url):
+    digest = hashlib.sha256(repo_url.encode('utf-8')).hexdigest()[:16]
+    name = os.path.basename(repo_url.rstrip('/')).lstrip('.') or 'repo'
+    return os.path.join(cache_dir, 'mirrors', f"{digest}-{name}")
+
+# Function to serialize fetches and worktree bookkeeping on one mirror across processes
+@contextmanager
+def mirror_lock(mirror_dir):
+    os.makedirs(os.path.dirname(mirror_dir), exist_ok=True)
+    with open(mirror_dir + '.lock', 'w') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+# Function to resolve a revision to a commit sha, returning None if it is not present locally
+def resolve_commit(repo, revision):
+    try:
+        return repo.git.rev_parse('--verify', '--quiet', f'{revision}^{{commit}}')
+    except git.GitCommandError:
+        return None
+
+# Function to make sure the requested commit is present in the local bare mirror
+def update_mirror(repo_url, commit_id, cache_dir):
+    path = mirror_path(cache_dir, repo_url)
+    with mirror_lock(path):
+        if os.path.exists(path):
+            repo = git.Repo(path)
+        else:
+            logging.info(f"Creating mirror of {repo_url} in {path}")
+            repo = git.Repo.init(path, bare=True)
+            repo.create_remote('origin', repo_url)
+
+        if FULL_SHA_PATTERN.match(commit_id):
+            sha = resolve_commit(repo, commit_id)
+            if sha:
+                logging.info(f"Commit {commit_id} already present in mirror {path}")
+                return repo, sha
+
+        logging.info(f"Fetching {commit_id} from {repo_url}")
+        try:
+            # Only the requested commit at depth 1; objects already in the mirror are not transferred again
+            repo.git.fetch('--depth', '1', 'origin', commit_id)
+            sha = resolve_commit(repo, 'FETCH_HEAD')
+        except git.GitCommandError as e:
+            # Some servers refuse to serve commits by sha, so fall back to fetching all branches and tags
+            logging.warning(f"Shallow fetch of {commit_id} failed, fetching all refs instead: {e}")
+            repo.git.fetch('origin', '+refs/heads/*:refs/heads/*', '+refs/tags/*:refs/tags/*')
+            sha = resolve_commit(repo, commit_id)
+        if not sha:
+            raise ValueError(f"Commit {commit_id} not found in {repo_url}")
+
+        # Keep a ref on every fetched commit so it survives gc and is advertised on the next fetch
+        repo.git.update_ref(f'refs/qa/{sha}', sha)
+        return repo, sha
+
+# Function to check out a commit into a private, sparse worktree of the mirror.
+# A mirror already returned by update_mirror can be passed with commit_id set to the sha it resolved, so it is not fetched again.
+@contextmanager
+def checkout_repo(repo_url, commit_id, patterns, cache_dir=None, mirror=None):
+    temporary_cache = None
+    if not cache_dir:
+        temporary_cache = cache_dir = tempfile.mkdtemp(prefix='qa-cache-')
+
+    start_time = time.time()
+    lock_path = mirror_path(cache_dir, repo_url)
+    if mirror is None:
+        with span('mirror'):
+            mirror, sha = update_mirror(repo_url, commit_id, cache_dir)
+    else:
+        sha = commit_id
+    work_dir = tempfile.mkdtemp(prefix='qa-repo-')
+    try:
+        with span('checkout', commit=sha):
+            with mirror_lock(lock_path):
+                mirror.git.worktree('add', '--no-checkout', '--detach', work_dir, sha)
+            worktree = git.Repo(work_dir)
+            if patterns:
+                # The sparse-checkout file lives in the worktree's own git dir, so the shared mirror config is untouched
+                sparse_file = os.path.join(worktree.git_dir, 'info', 'sparse-checkout')
+                os.makedirs(os.path.dirname(sparse_file), exist_ok=True)
+                with open(sparse_file, 'w') as file:
+                    file.write("\n".join(patterns) + "\n")
+                worktree.git.execute(['git', '-c', 'core.sparseCheckout=true', '-c', 'core.sparseCheckoutCone=false', 'read-tree', '-mu', 'HEAD'])
+            else:
+                worktree.git.read_tree('-mu', 'HEAD')
+        clone_time = time.time() - start_time
+        logging.info(f"Checked out {sha} of {repo_url} into {work_dir} in {clone_time:.2f} seconds")
+        yield work_dir, clone_time
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+        with mirror_lock(lock_path):
+            mirror.git.worktree('prune')
+        if temporary_cache:
+            shutil.rmtree(temporary_cache, ignore_errors=True)
+
+# Function to list the paths that differ between two commits of the mirror, or None if the old commit is gone
+def changed_paths(repo, old_sha, new_sha):
+    if old_sha == new_sha:
+        return set()
+    if not resolve_commit(repo, old_sha):
+        logging.warning(f"Previous commit {old_sha} is no longer in the mirror, running a full build")
+        return None
+    # Without rename detection a renamed file shows up under both its old and its new path
+    output = repo.git.diff('--name-only', '--no-renames', '-z', old_sha, new_sha)
+    return set(path for path in output.split('\0') if path)
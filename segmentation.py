@@ -0,0 +1,56 @@
+# This module only depends on NLTK so that segmentation worker processes start without importing torch.
+# NLTK itself takes seconds to import, so it is only imported once there is text to segment.
+
+import logging
+
+# Characters of text sent to a segmentation worker per task
+SEGMENT_TASK_CHARS = 256 * 1024
+
+# NLTK data the sentence tokenizer needs, as (package, resource path) pairs
+NLTK_RESOURCES = [('punkt', 'tokenizers/punkt')]
+
+# NLTK resources found or downloaded by this process
+_nltk_ready = set()
+
+# Function to download the NLTK data that is not installed locally yet, without touching the network otherwise
+def ensure_nltk_data(resources=NLTK_RESOURCES):
+    import nltk
+    for package, resource in resources:
+        if resource in _nltk_ready:
+            continue
+        try:
+            nltk.data.find(resource)
+        except LookupError:
+            logging.info(f"Downloading NLTK data '{package}'")
+            nltk.download(package, quiet=True)
+        _nltk_ready.add(resource)
+
+# Function to split texts into sentences, returning the (start, end) character spans of the sentences of each text
+def segment_texts(texts):
+    from nltk.tokenize import sent_tokenize
+    ensure_nltk_data()
+    results = []
+    for text in texts:
+        spans = []
+        position = 0
+        for sentence in sent_tokenize(text):
+            start = text.find(sentence, position)
+            if start == -1:
+                start = position
+            position = start + len(sentence)
+            spans.append((start, position))
+        results.append(spans)
+    return results
+
+# Function to group texts into worker tasks of roughly task_chars characters
+def iter_segment_tasks(texts, task_chars=SEGMENT_TASK_CHARS):
+    task = []
+    length = 0
+    for text in texts:
+        task.append(text)
+        length += len(text)
+        if length >= task_chars:
+            yield task
+            task, length = [], 0
+    if task:
+        yield task
@@ -0,0 +1,134 @@
+import os
+import sys
+import glob
+import time
+import random
+import logging
+import shutil
+import argparse
+import tempfile
+import tracemalloc
+from nltk.tokenize import blankline_tokenize
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from generate_project_qa import read_git_repo, iter_file_records, KeywordMatcher, DEFAULT_MAX_FILE_BYTES
+
+WORDS = "instructlab open source project community collaboration model tuning method taxonomy skills knowledge data training mission the a of to and".split()
+KEYWORDS = ["InstructLab", "getting started", "collaboration", "open source", "tuning method", "mission"]
+
+# Function to write a synthetic documentation tree of roughly total_bytes bytes
+def write_corpus(base_dir, total_bytes, file_bytes=8192):
+    rng = random.Random(42)
+    written = 0
+    index = 0
+    while written < total_bytes:
+        path = os.path.join(base_dir, f"dir{index % 16}", f"doc{index}.md")
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        paragraphs = []
+        size = 0
+        while size < file_bytes:
+            paragraph = " ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 40))) + "."
+            paragraphs.append(paragraph)
+            size += len(paragraph) + 2
+        with open(path, 'w') as file:
+            file.write("\n\n".join(paragraphs))
+        written += size
+        index += 1
+    return index
+
+# The file reader of the original script, without the clone: a glob per pattern, a binary sniff and a text-mode read per file
+def legacy_read_git_repo(repo_dir, patterns, max_files):
+    content = {}
+    file_count = 0
+    for pattern in patterns:
+        file_paths = glob.glob(os.path.join(repo_dir, pattern), recursive=True)
+        for file_path in file_paths:
+            if os.path.isdir(file_path):
+                continue
+            if file_count >= max_files:
+                break
+            with open(file_path, 'rb') as file:
+                chunk = file.read(1024)
+            text_characters = bytearray({7, 8, 9, 10, 12, 13, 27} | set(range(0x20, 0x100)))
+            if bool(chunk.translate(None, text_characters)):
+                logging.warning(f"Skipping binary file: {file_path}")
+                continue
+            start_time = time.time()
+            try:
+                with open(file_path, 'r', encoding='utf-8') as file:
+                    content[file_path] = file.read()
+                read_time = time.time() - start_time
+                file_count += 1
+                logging.info(f"Read file: {file_path} in {read_time:.2f} seconds")
+            except UnicodeDecodeError as e:
+                logging.error(f"Error reading file {file_path}: {e}")
+                continue
+        if file_count >= max_files:
+            break
+    return content
+
+# The section extraction of the original script: NLTK blank-line paragraphs and a substring scan per keyword
+def legacy_extract_relevant_sections(text, keywords):
+    sections = []
+    paragraphs = blankline_tokenize(text)
+    for paragraph in paragraphs:
+        for keyword in keywords:
+            if keyword.lower() in paragraph.lower():
+                sections.append(paragraph)
+                break
+    return sections
+
+# The corpus loop of the original generate_yaml: every file in memory, concatenated under the line cap, then filtered
+# Files are joined without a blank line, so the last paragraph of a file merges with the first of the next one and
+# the legacy path reports slightly fewer sections
+def legacy_pipeline(base_dir, patterns, max_files, max_lines):
+    repo_content = legacy_read_git_repo(base_dir, patterns, max_files)
+    combined_content = ""
+    for file_path, file_content in repo_content.items():
+        lines = file_content.split('\n')
+        combined_content += "\n".join(lines[:max_lines]) + "\n"
+        if len(combined_content.split('\n')) >= max_lines:
+            break
+    return len(legacy_extract_relevant_sections(combined_content, KEYWORDS))
+
+# Function to run the shipped corpus path of build_corpus up to the per-file section records
+def streaming_pipeline(base_dir, patterns, max_files, max_lines, read_workers=4):
+    matcher = KeywordMatcher(KEYWORDS)
+    files = read_git_repo(base_dir, patterns, max_files, None, DEFAULT_MAX_FILE_BYTES, read_workers)
+    return sum(len(record['sections']) for _, record in iter_file_records(base_dir, files, max_lines, matcher, None, DEFAULT_MAX_FILE_BYTES))
+
+# Function to measure wall time and peak traced memory of one pipeline run
+def measure(pipeline, *args):
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    sections = pipeline(*args)
+    elapsed = time.perf_counter() - start_time
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return elapsed, peak, sections
+
+# Main script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the corpus pipeline against corpus size.")
+    parser.add_argument('--sizes_mb', type=float, nargs='+', default=[1, 2, 4, 8, 16], help='Corpus sizes to generate, in MB')
+    parser.add_argument('--skip_legacy', action='store_true', help='Only benchmark the streaming pipeline')
+    parser.add_argument('--read_workers', type=int, default=4, help='Reader threads of the streaming pipeline')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+
+    print(f"{'size_mb':>8} {'files':>7} {'pipeline':>10} {'seconds':>9} {'s_per_mb':>9} {'peak_mb':>8} {'sections':>8}")
+    for size_mb in args.sizes_mb:
+        base_dir = tempfile.mkdtemp(prefix='qa-bench-')
+        try:
+            file_count = write_corpus(base_dir, int(size_mb * 1024 * 1024))
+            # Caps large enough that the whole corpus flows through the pipeline
+            run_args = (base_dir, ['**/*.md'], file_count, 10 ** 9)
+            pipelines = [('streaming', lambda *pipeline_args: streaming_pipeline(*pipeline_args, args.read_workers))]
+            if not args.skip_legacy:
+                pipelines.append(('legacy', legacy_pipeline))
+            for name, pipeline in pipelines:
+                elapsed, peak, sections = measure(pipeline, *run_args)
+                print(f"{size_mb:>8.1f} {file_count:>7} {name:>10} {elapsed:>9.3f} {elapsed / size_mb:>9.3f} {peak / 1024 / 1024:>8.2f} {sections:>8}")
+        finally:
+            shutil.rmtree(base_dir, ignore_errors=True)
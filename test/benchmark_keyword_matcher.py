@@ -0,0 +1,70 @@
+import os
+import sys
+import time
+import random
+import logging
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from generate_project_qa import KeywordMatcher
+
+WORDS = "instructlab open source project community collaboration model tuning method taxonomy skills knowledge data training mission the a of to and".split()
+
+# The per-keyword substring scan section extraction used before the compiled matcher
+def legacy_filter(paragraphs, keywords):
+    sections = []
+    for paragraph in paragraphs:
+        for keyword in keywords:
+            if keyword.lower() in paragraph.lower():
+                sections.append(paragraph)
+                break
+    return sections
+
+# Function to filter paragraphs with the compiled matcher
+def matcher_filter(paragraphs, matcher):
+    return [paragraph for paragraph in paragraphs if matcher.search(paragraph)]
+
+# Function to generate a keyword list of the given size, mostly terms that never occur
+def make_keywords(count, rng):
+    # 'tuning method' and 'taxonomy' stem to 'tune method' and 'taxonomi', which are not prefixes of the words
+    keywords = ["mission", "tuning method", "taxonomy"]
+    while len(keywords) < count:
+        keywords.append("".join(rng.choice("abcdefghijklmnopqrstuvwxyz") for _ in range(rng.randint(5, 12))))
+    # Put the keywords that do occur last, the worst case for the per-keyword scan
+    return keywords[3:] + keywords[:3]
+
+# Function to time a callable over several repeats and keep the best run
+def best_time(function, repeats):
+    timings = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        result = function()
+        timings.append(time.perf_counter() - start_time)
+    return min(timings), result
+
+# Main script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Micro-benchmark the keyword matcher against the per-keyword scan.")
+    parser.add_argument('--paragraphs', type=int, default=5000, help='Number of synthetic paragraphs')
+    parser.add_argument('--keyword_counts', type=int, nargs='+', default=[8, 50, 100, 200], help='Keyword list sizes to benchmark')
+    parser.add_argument('--repeats', type=int, default=3, help='Repeats per measurement, the best one is reported')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    rng = random.Random(42)
+    paragraphs = [" ".join(rng.choice(WORDS) for _ in range(rng.randint(20, 80))) for _ in range(args.paragraphs)]
+
+    print(f"{'keywords':>8} {'legacy_s':>9} {'compiled_s':>10} {'boundary_s':>10} {'stemmed_s':>9} {'speedup':>8}")
+    for count in args.keyword_counts:
+        keywords = make_keywords(count, rng)
+        legacy_time, legacy_sections = best_time(lambda: legacy_filter(paragraphs, keywords), args.repeats)
+        matcher = KeywordMatcher(keywords)
+        compiled_time, compiled_sections = best_time(lambda: matcher_filter(paragraphs, matcher), args.repeats)
+        assert compiled_sections == legacy_sections, "compiled matcher disagrees with the per-keyword scan"
+        boundary_matcher = KeywordMatcher(keywords, word_boundary=True)
+        boundary_time, _ = best_time(lambda: matcher_filter(paragraphs, boundary_matcher), args.repeats)
+        stemmed_matcher = KeywordMatcher(keywords, stem=True)
+        stemmed_time, stemmed_sections = best_time(lambda: matcher_filter(paragraphs, stemmed_matcher), args.repeats)
+        # Stemming only adds inflected matches, it never drops a paragraph the plain matcher keeps
+        assert set(compiled_sections) <= set(stemmed_sections), "stemmed matcher misses paragraphs the plain matcher keeps"
+        print(f"{count:>8} {legacy_time:>9.3f} {compiled_time:>10.3f} {boundary_time:>10.3f} {stemmed_time:>9.3f} {legacy_time / compiled_time:>7.1f}x")
@@ -0,0 +1,199 @@
+import io
+import os
+import sys
+import json
+import random
+import shutil
+import hashlib
+import logging
+import argparse
+import tempfile
+import contextlib
+import numpy as np
+import yaml
+import git
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import generate_project_qa
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+DEFAULT_BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmark_baseline.json')
+
+WORDS = "open source project community collaboration model tuning method taxonomy skills knowledge data training the a of to and with for is on".split()
+KEYWORDS = ["InstructLab", "getting started", "problems", "created", "collaboration", "open source", "tuning method", "mission"]
+
+# Synthetic repository shapes: number of files, paragraphs per file and directory depth
+SCENARIOS = {
+    'small': {'files': 50, 'paragraphs': 20, 'depth': 2},
+    'medium': {'files': 400, 'paragraphs': 40, 'depth': 4},
+    'large': {'files': 2000, 'paragraphs': 60, 'depth': 6},
+}
+
+# Deterministic stand-in for a SentenceTransformer: hashes the words of a sentence into a fixed-size vector,
+# so the pipeline can be benchmarked offline and every run scores the same answers
+class StubEncoder:
+    def __init__(self, dimension=384):
+        self.dimension = dimension
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, sentences, convert_to_numpy=True, **kwargs):
+        embeddings = np.zeros((len(sentences), self.dimension), dtype=np.float32)
+        for row, sentence in enumerate(sentences):
+            for word in sentence.lower().split():
+                digest = int.from_bytes(hashlib.blake2b(word.encode('utf-8'), digest_size=8).digest(), 'little')
+                embeddings[row, digest % self.dimension] += 1.0 if digest & (1 << 63) else -1.0
+        return embeddings
+
+# Function to write a paragraph of random words, mentioning a keyword with the given probability
+def make_paragraph(rng, keyword_density):
+    words = [rng.choice(WORDS) for _ in range(rng.randint(15, 60))]
+    if rng.random() < keyword_density:
+        words.insert(rng.randrange(len(words)), rng.choice(KEYWORDS))
+    # Split the paragraph into sentences of 5 to 15 words
+    sentences = []
+    while words:
+        length = rng.randint(5, 15)
+        sentences.append(" ".join(words[:length]).capitalize() + ".")
+        words = words[length:]
+    return " ".join(sentences)
+
+# Function to create a committed git repository of markdown and code files, returning the commit sha
+def make_synthetic_repo(repo_dir, files, paragraphs, depth, keyword_density=0.3, code_ratio=0.25, seed=42):
+    rng = random.Random(seed)
+    for index in range(files):
+        parts = [f"dir{rng.randrange(4)}" for _ in range(rng.randint(0, depth))]
+        if rng.random() < code_ratio:
+            path = os.path.join(repo_dir, *parts, f"module{index}.py")
+            lines = [f"# {make_paragraph(rng, keyword_density)}" if i % 3 == 0 else f"value_{i} = {i}" for i in range(paragraphs * 3)]
+            content = "\n".join(lines) + "\n"
+        else:
+            path = os.path.join(repo_dir, *parts, f"doc{index}.md")
+            content = f"# Document {index}\n\n" + "\n\n".join(make_paragraph(rng, keyword_density) for _ in range(paragraphs)) + "\n"
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(content)
+
+    repo = git.Repo.init(repo_dir)
+    repo.git.add('--all')
+    actor = git.Actor('benchmark', 'benchmark@example.com')
+    return repo.index.commit('Synthetic corpus', author=actor, committer=actor).hexsha
+
+# Function to build the project configuration of a benchmark run from the shipped configuration
+def make_config(repo_dir, commit_id, cache_dir, model_name, max_files, max_lines):
+    with open(os.path.join(ROOT_DIR, 'configs', 'config.yaml'), 'r') as file:
+        config = yaml.safe_load(file)
+    config.update({
+        'project_name': 'Benchmark',
+        'repo_url': f'file://{os.path.abspath(repo_dir)}',
+        'commit_id': commit_id,
+        'patterns': ['**/*.md', '**/*.py'],
+        'keywords': KEYWORDS,
+        'max_files': max_files,
+        'max_lines': max_lines,
+        'min_answers': 0,
+        'model_list': [model_name],
+        'model_name': model_name,
+        'cache_dir': cache_dir,
+        'optimize': False,
+        'incremental': False,
+        'profile_stages': [],
+    })
+    return config
+
+# Function to flatten a trace into {stage path: {'seconds', 'peak_rss_mb'}}, summing repeated stages
+def flatten_trace(node, prefix=None, stages=None):
+    stages = {} if stages is None else stages
+    path = 'total' if prefix is None else f"{prefix}/{node['name']}".lstrip('/')
+    stage = stages.setdefault(path, {'seconds': 0.0, 'peak_rss_mb': 0.0})
+    stage['seconds'] += node['duration']
+    if 'peak_rss_bytes' in node:
+        stage['peak_rss_mb'] = max(stage['peak_rss_mb'], node['peak_rss_bytes'] / 1024 / 1024)
+    for child in node.get('children', []):
+        flatten_trace(child, '' if prefix is None else path, stages)
+    return stages
+
+# Function to run one scenario several times and keep the fastest run of every stage
+def run_scenario(name, shape, args, work_dir):
+    repo_dir = os.path.join(work_dir, f'repo-{name}')
+    commit_id = make_synthetic_repo(repo_dir, shape['files'], shape['paragraphs'], shape['depth'], args.keyword_density, args.code_ratio)
+    best = {}
+    for repeat in range(args.repeats):
+        # A fresh cache per repeat measures the cold path unless warm caches were requested
+        cache_dir = os.path.join(work_dir, 'cache' if args.warm else f'cache-{name}-{repeat}')
+        output_dir = os.path.join(work_dir, f'output-{name}-{repeat}')
+        config = make_config(repo_dir, commit_id, cache_dir, args.model, shape['files'], 10 ** 9)
+        # The QnA pairs printed by every run are not part of the benchmark output
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_project_qa.run_config(config, output_dir=output_dir)
+        with open(os.path.join(output_dir, 'trace.json'), 'r') as file:
+            stages = flatten_trace(json.load(file))
+        for path, stage in stages.items():
+            if path not in best or stage['seconds'] < best[path]['seconds']:
+                best[path] = stage
+    return best
+
+# Function to compare results with a baseline, returning the list of regressions
+def compare(results, baseline, tolerance, min_seconds):
+    regressions = []
+    print(f"{'scenario':<8} {'stage':<34} {'seconds':>9} {'baseline':>9} {'ratio':>6} {'rss_mb':>8} {'base_mb':>8}")
+    for scenario, stages in results.items():
+        for path, stage in stages.items():
+            base = baseline.get(scenario, {}).get(path)
+            ratio = stage['seconds'] / base['seconds'] if base and base['seconds'] > 0 else None
+            flag = ''
+            if base:
+                slower = stage['seconds'] > base['seconds'] * (1 + tolerance) and stage['seconds'] - base['seconds'] > min_seconds
+                bigger = base['peak_rss_mb'] > 0 and stage['peak_rss_mb'] > base['peak_rss_mb'] * (1 + tolerance)
+                if slower or bigger:
+                    flag = ' REGRESSION'
+                    regressions.append((scenario, path, 'time' if slower else 'memory'))
+            print(f"{scenario:<8} {path:<34} {stage['seconds']:>9.3f} "
+                  f"{base['seconds'] if base else float('nan'):>9.3f} {ratio if ratio else float('nan'):>6.2f} "
+                  f"{stage['peak_rss_mb']:>8.1f} {base['peak_rss_mb'] if base else float('nan'):>8.1f}{flag}")
+    return regressions
+
+# Main script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark every stage of generate_project_qa.py on synthetic repositories.")
+    parser.add_argument('--scenarios', nargs='+', default=['small', 'medium'], choices=sorted(SCENARIOS), help='Repository shapes to benchmark')
+    parser.add_argument('--repeats', type=int, default=3, help='Runs per scenario, the fastest run of each stage is kept')
+    parser.add_argument('--keyword_density', type=float, default=0.3, help='Fraction of paragraphs mentioning a keyword')
+    parser.add_argument('--code_ratio', type=float, default=0.25, help='Fraction of files that are Python code instead of markdown')
+    parser.add_argument('--model', type=str, default='stub', help="Embedding model, 'stub' for the deterministic offline encoder or a local SentenceTransformer path")
+    parser.add_argument('--warm', action='store_true', help='Share the caches between repeats to measure the warm path')
+    parser.add_argument('--baseline', type=str, default=DEFAULT_BASELINE, help='Baseline JSON to compare against')
+    parser.add_argument('--save_baseline', action='store_true', help='Store these results as the new baseline instead of comparing')
+    parser.add_argument('--tolerance', type=float, default=0.25, help='Allowed relative slowdown or memory growth per stage')
+    parser.add_argument('--min_seconds', type=float, default=0.05, help='Slowdowns smaller than this many seconds are ignored as noise')
+    args = parser.parse_args()
+
+    logging.disable(logging.WARNING)
+    if args.model == 'stub':
+        # A model already in the pool is never loaded from disk
+        generate_project_qa._model_pool['stub'] = StubEncoder()
+
+    work_dir = tempfile.mkdtemp(prefix='qa-benchmark-')
+    try:
+        results = {name: run_scenario(name, SCENARIOS[name], args, work_dir) for name in args.scenarios}
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as file:
+            json.dump(results, file, indent=2, sort_keys=True)
+        compare(results, results, args.tolerance, args.min_seconds)
+        print(f"Baseline saved to {args.baseline}")
+        sys.exit(0)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r') as file:
+            baseline = json.load(file)
+    else:
+        print(f"No baseline at {args.baseline}, record one with --save_baseline")
+    regressions = compare(results, baseline, args.tolerance, args.min_seconds)
+    if regressions:
+        print(f"{len(regressions)} stage(s) regressed: " + ", ".join(f"{scenario}:{path} ({kind})" for scenario, path, kind in regressions))
+        sys.exit(1)
@@ -0,0 +1,71 @@
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+ROOT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+# Entry points and their startup budget in seconds for `<script> --help`
+ENTRY_POINTS = {
+    'generate_project_qa.py': 1.0,
+    'batch_generate_qa.py': 1.0,
+    'config-generator.py': 0.5,
+}
+
+# Heavy packages that must only be imported by the stage that uses them, never at startup
+LAZY_PACKAGES = ['sentence_transformers', 'torch', 'transformers', 'pandas', 'pyarrow', 'prometheus_client', 'requests', 'nltk']
+
+# Function to run an entry point with --help under -X importtime, returning the wall time and
+# {module: (cumulative seconds, nesting depth)}, depth 0 being the imports of the script itself
+def measure(script):
+    start_time = time.perf_counter()
+    result = subprocess.run([sys.executable, '-X', 'importtime', os.path.join(ROOT_DIR, script), '--help'], capture_output=True, text=True, cwd=ROOT_DIR)
+    elapsed = time.perf_counter() - start_time
+    if result.returncode != 0:
+        raise RuntimeError(f"{script} --help failed: {result.stderr[-2000:]}")
+    modules = {}
+    for line in result.stderr.splitlines():
+        # import time:      self [us] |  cumulative | imported package
+        if not line.startswith('import time:') or 'imported package' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        modules[name.strip()] = (int(cumulative) / 1e6, depth)
+    return elapsed, modules
+
+# Function to return the lazily imported packages that an entry point imported at startup
+def eager_imports(modules):
+    return sorted({name.split('.')[0] for name in modules} & set(LAZY_PACKAGES))
+
+# Main script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check the startup time of the entry points against an import-time budget.")
+    parser.add_argument('--scripts', nargs='+', default=sorted(ENTRY_POINTS), choices=sorted(ENTRY_POINTS), help='Entry points to measure')
+    parser.add_argument('--repeats', type=int, default=5, help='Runs per entry point, the median is compared with the budget')
+    parser.add_argument('--scale', type=float, default=1.0, help='Multiplier of every budget, e.g. 2 on a slow CI machine')
+    parser.add_argument('--top', type=int, default=8, help='Number of slowest top-level imports to list per entry point')
+    args = parser.parse_args()
+
+    failures = []
+    for script in args.scripts:
+        runs = [measure(script) for _ in range(args.repeats)]
+        median = statistics.median(elapsed for elapsed, _ in runs)
+        budget = ENTRY_POINTS[script] * args.scale
+        modules = runs[-1][1]
+        eager = eager_imports(modules)
+        status = 'ok' if median <= budget and not eager else 'OVER BUDGET'
+        print(f"{script:<26} {median:>6.3f}s (budget {budget:.3f}s) {status}")
+        # Top-level imports of the script itself, slowest first
+        top_level = sorted(((seconds, name) for name, (seconds, depth) in modules.items() if depth == 0), reverse=True)
+        for seconds, name in top_level[:args.top]:
+            print(f"    {seconds:>6.3f}s {name}")
+        if eager:
+            print(f"    imported at startup, should be lazy: {', '.join(eager)}")
+        if status != 'ok':
+            failures.append(script)
+
+    if failures:
+        print(f"{len(failures)} entry point(s) over budget: {', '.join(failures)}")
+        sys.exit(1)
@@ -0,0 +1,57 @@
+import sys
+import time
+import logging
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Local stand-in for a Prometheus Pushgateway that records every push and can simulate an unhealthy gateway
+class PushgatewayStub(ThreadingHTTPServer):
+    def __init__(self, address, fail_first=0, delay=0.0):
+        super().__init__(address, PushHandler)
+        self.fail_first = fail_first
+        self.delay = delay
+        self.requests = []
+        self.pushes = []
+        self.lock = threading.Lock()
+
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_address[1]}"
+
+# Request handler answering 503 to the first fail_first pushes and 200 afterwards
+class PushHandler(BaseHTTPRequestHandler):
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        time.sleep(self.server.delay)
+        with self.server.lock:
+            self.server.requests.append(self.path)
+            failing = len(self.server.requests) <= self.server.fail_first
+            if not failing:
+                self.server.pushes.append((self.path, body.decode('utf-8')))
+        self.send_response(503 if failing else 200)
+        self.end_headers()
+
+    do_PUT = do_POST
+
+    def log_message(self, format, *args):
+        logging.info(f"Pushgateway stub: {format % args}")
+
+# Function to start a stub gateway on a background thread, returning the server
+def start_stub(port=0, fail_first=0, delay=0.0):
+    server = PushgatewayStub(('127.0.0.1', port), fail_first, delay)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+# Main script
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run a local stand-in Pushgateway that logs every push.")
+    parser.add_argument('--port', type=int, default=9091, help='Port to listen on')
+    parser.add_argument('--fail_first', type=int, default=0, help='Answer 503 to this many pushes before accepting them')
+    parser.add_argument('--delay', type=float, default=0.0, help='Seconds to wait before answering each push')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, stream=sys.stdout, format='%(asctime)s - %(levelname)s - %(message)s')
+    server = PushgatewayStub(('127.0.0.1', args.port), args.fail_first, args.delay)
+    logging.info(f"Pushgateway stub listening on {server.url}")
+    server.serve_forever()
@@ -0,0 +1,100 @@
+import io
+import os
+import sys
+import time
+import socket
+import contextlib
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import generate_project_qa
+from pushgateway import PushgatewayExporter, close_exporters
+from pushgateway_stub import start_stub
+
+# Function to return the URL of a local port nothing listens on
+def unreachable_url():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        port = sock.getsockname()[1]
+    return f"http://127.0.0.1:{port}"
+
+@pytest.fixture
+def stub():
+    servers = []
+    def start(**options):
+        servers.append(start_stub(**options))
+        return servers[-1]
+    yield start
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def test_retries_503_with_backoff(stub):
+    server = stub(fail_first=2)
+    exporter = PushgatewayExporter(server.url, backoff=0.1, max_backoff=1.0)
+    start_time = time.perf_counter()
+    exporter.submit('job/retry', b'metric 1\n')
+    exporter.close(timeout=10)
+    elapsed = time.perf_counter() - start_time
+
+    assert server.requests == ['/metrics/job/retry'] * 3
+    assert server.pushes == [('/metrics/job/retry', 'metric 1\n')]
+    assert (exporter.sent, exporter.failed) == (1, 0)
+    # Two backoffs of at least half of 0.1 s and 0.2 s, jitter included
+    assert elapsed >= 0.15
+
+def test_drops_the_oldest_push_when_the_queue_is_full(stub):
+    server = stub(delay=0.5)
+    exporter = PushgatewayExporter(server.url, queue_size=2)
+    exporter.submit('job/a', b'a 1\n')
+    # Wait until the background thread is busy sending the first push, so the queue is empty again
+    deadline = time.time() + 5
+    while exporter.queue.qsize() and time.time() < deadline:
+        time.sleep(0.01)
+    for name in 'bcd':
+        exporter.submit(f'job/{name}', f'{name} 1\n'.encode('utf-8'))
+    exporter.close(timeout=10)
+
+    assert exporter.dropped == 1
+    assert [path for path, _ in server.pushes] == ['/metrics/job/a', '/metrics/job/c', '/metrics/job/d']
+
+def test_close_is_bounded_when_the_gateway_is_unreachable():
+    exporter = PushgatewayExporter(unreachable_url(), timeout=1.0, max_retries=10, backoff=5.0)
+    exporter.submit('job/unreachable', b'metric 1\n')
+    start_time = time.perf_counter()
+    exporter.close(timeout=1.0)
+    elapsed = time.perf_counter() - start_time
+
+    assert elapsed < 3.0
+    assert not exporter.thread.is_alive()
+    assert exporter.sent == 0
+
+def test_optimize_sweep_pushes_once_per_run(stub, tmp_path):
+    nltk = pytest.importorskip('nltk')
+    try:
+        nltk.data.find('tokenizers/punkt')
+    except LookupError:
+        pytest.skip("NLTK punkt data is not installed")
+    from benchmark_suite import StubEncoder, make_synthetic_repo, make_config
+
+    server = stub()
+    repo_dir = str(tmp_path / 'repo')
+    commit_id = make_synthetic_repo(repo_dir, files=20, paragraphs=10, depth=2)
+    models = ['stub-a', 'stub-b']
+    for model in models:
+        generate_project_qa._model_pool[model] = StubEncoder()
+    config = make_config(repo_dir, commit_id, str(tmp_path / 'cache'), models[0], 20, 10 ** 6)
+    config.update({'optimize': True, 'model_list': models, 'pushgateway_url': server.url})
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            generate_project_qa.run_config(config, enable_prometheus=True, output_dir=str(tmp_path / 'output'))
+        close_exporters()
+    finally:
+        for model in models:
+            generate_project_qa._model_pool.pop(model, None)
+
+    # Every model of the sweep is in one push to the job's grouping path
+    assert server.requests == [f"/metrics/job/{config['project_name']}"]
+    body = server.pushes[0][1]
+    for model in models:
+        assert f'instance="{model}"' in body
@@ -0,0 +1,117 @@
+import os
+import sys
+import shutil
+import threading
+import git
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+from repo_mirror import checkout_repo, update_mirror, changed_paths, mirror_path
+
+# Function to commit files into a repository, returning the commit sha
+def commit_files(repo, files, message):
+    for rel_path, content in files.items():
+        path = os.path.join(repo.working_tree_dir, rel_path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as file:
+            file.write(content)
+    repo.git.add('--all')
+    actor = git.Actor('test', 'test@example.com')
+    return repo.index.commit(message, author=actor, committer=actor).hexsha
+
+# Function to create a source repository with two commits on main, served over file:// so fetches honour --depth
+def make_source(tmp_path):
+    source_dir = tmp_path / 'source'
+    repo = git.Repo.init(source_dir, initial_branch='main')
+    # Let the mirror fetch commits by sha, like GitHub does
+    with repo.config_writer() as config:
+        config.set_value('uploadpack', 'allowAnySHA1InWant', 'true')
+    first = commit_files(repo, {'README.md': 'first\n', 'docs/guide.md': 'guide\n', 'src/app.py': 'print(1)\n'}, 'first')
+    second = commit_files(repo, {'docs/guide.md': 'guide v2\n', 'docs/new.md': 'new\n'}, 'second')
+    return f'file://{source_dir}', first, second
+
+# Function to list the files of a checkout, without git metadata
+def checkout_files(work_dir):
+    files = set()
+    for dir_path, dir_names, file_names in os.walk(work_dir):
+        dir_names[:] = [name for name in dir_names if name != '.git']
+        files.update(os.path.relpath(os.path.join(dir_path, name), work_dir) for name in file_names)
+    files.discard('.git')
+    return files
+
+def test_fetches_a_sha_at_depth_one(tmp_path):
+    repo_url, first, second = make_source(tmp_path)
+    mirror, sha = update_mirror(repo_url, second, str(tmp_path / 'cache'))
+    assert sha == second
+    assert mirror.git.rev_parse('--is-shallow-repository') == 'true'
+    assert mirror.git.rev_list('--count', sha) == '1'
+
+def test_fetches_a_branch_name_at_depth_one(tmp_path):
+    repo_url, first, second = make_source(tmp_path)
+    mirror, sha = update_mirror(repo_url, 'main', str(tmp_path / 'cache'))
+    assert sha == second
+    assert mirror.git.rev_list('--count', sha) == '1'
+
+def test_second_run_fetches_nothing(tmp_path):
+    repo_url, first, second = make_source(tmp_path)
+    cache_dir = str(tmp_path / 'cache')
+    update_mirror(repo_url, second, cache_dir)
+    # With the source gone, the second run can only succeed if it never talks to the remote
+    shutil.rmtree(tmp_path / 'source')
+    mirror, sha = update_mirror(repo_url, second, cache_dir)
+    assert sha == second
+    with checkout_repo(repo_url, second, ['docs/*.md'], cache_dir) as (work_dir, _):
+        assert checkout_files(work_dir) == {'docs/guide.md', 'docs/new.md'}
+
+def test_sparse_checkout_is_limited_to_the_patterns(tmp_path):
+    repo_url, first, second = make_source(tmp_path)
+    with checkout_repo(repo_url, second, ['docs/*.md'], str(tmp_path / 'cache')) as (work_dir, _):
+        assert checkout_files(work_dir) == {'docs/guide.md', 'docs/new.md'}
+        with open(os.path.join(work_dir, 'docs', 'guide.md')) as file:
+            assert file.read() == 'guide v2\n'
+    assert not os.path.exists(work_dir)
+
+def test_concurrent_worktrees_share_one_mirror(tmp_path):
+    repo_url, first, second = make_source(tmp_path)
+    cache_dir = str(tmp_path / 'cache')
+    update_mirror(repo_url, first, cache_dir)
+    update_mirror(repo_url, second, cache_dir)
+
+    # Both checkouts stay open at the same time, taken from two threads
+    both_open = threading.Barrier(2, timeout=60)
+    results = {}
+    errors = []
+    def check_out(name, sha, patterns):
+        try:
+            with checkout_repo(repo_url, sha, patterns, cache_dir) as (work_dir, _):
+                both_open.wait()
+                files = checkout_files(work_dir)
+                with open(os.path.join(work_dir, 'docs', 'guide.md')) as file:
+                    results[name] = (work_dir, files, file.read())
+                both_open.wait()
+        except Exception as e:
+            errors.append(e)
+    threads = [threading.Thread(target=check_out, args=('first', first, ['**/*'])), threading.Thread(target=check_out, args=('second', second, ['docs/*.md']))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors
+    assert results['first'][0] != results['second'][0]
+    assert results['first'][1] == {'README.md', 'docs/guide.md', 'src/app.py'}
+    assert results['first'][2] == 'guide\n'
+    assert results['second'][1] == {'docs/guide.md', 'docs/new.md'}
+    assert results['second'][2] == 'guide v2\n'
+    # Both worktrees were pruned from the mirror when their checkouts closed
+    mirror = git.Repo(mirror_path(cache_dir, repo_url))
+    assert mirror.git.worktree('list', '--porcelain').count('worktree ') == 1
+
+def test_changed_paths_across_two_commits(tmp_path):
+    repo_url, first, second = make_source(tmp_path)
+    cache_dir = str(tmp_path / 'cache')
+    update_mirror(repo_url, first, cache_dir)
+    mirror, _ = update_mirror(repo_url, second, cache_dir)
+    assert changed_paths(mirror, first, second) == {'docs/guide.md', 'docs/new.md'}
+    assert changed_paths(mirror, second, second) == set()
+    # A commit that was never fetched cannot be diffed
+    assert changed_paths(mirror, '0' * 40, second) is None
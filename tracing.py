@@ -0,0 +1,224 @@
+import os
+import sys
+import json
+import time
+import logging
+import cProfile
+import resource
+import threading
+from contextlib import contextmanager
+
+# Writing 5 to clear_refs resets the peak resident set size (VmHWM) of the process on Linux
+CLEAR_REFS_PATH = '/proc/self/clear_refs'
+STATUS_PATH = '/proc/self/status'
+
+# The trace of the current run, shared by all threads; each thread keeps its own stack of open spans
+_trace = {'root': None, 'profile_stages': set(), 'profile_dir': '.', 'profile_count': 0, 'profiling': False}
+_lock = threading.Lock()
+_local = threading.local()
+
+# Function to read the peak resident set size of the process in bytes
+def read_peak_rss():
+    try:
+        with open(STATUS_PATH, 'r') as file:
+            for line in file:
+                if line.startswith('VmHWM:'):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+# Function to reset the peak resident set size so the next reading only covers what follows
+def reset_peak_rss():
+    try:
+        with open(CLEAR_REFS_PATH, 'w') as file:
+            file.write('5')
+        return True
+    except OSError:
+        # Without clear_refs every reading is the peak of the whole process so far
+        return False
+
+# One timed stage of a run. Spans opened with span() are timed once with their peak RSS,
+# spans created by traced() accumulate the time spent producing the items of an interleaved generator stage.
+class Span:
+    def __init__(self, name, attributes=None):
+        self.name = name
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self.duration = 0.0
+        self.peak_rss = None
+        self.counts = {}
+        self.children = []
+
+    # Add to an item count of this span, reported with its throughput
+    def count(self, key, amount=1):
+        self.counts[key] = self.counts.get(key, 0) + amount
+
+    # Return the child span with the given name, creating it on first use
+    def child(self, name):
+        with _lock:
+            for child in self.children:
+                if child.name == name:
+                    return child
+            child = Span(name)
+            self.children.append(child)
+            return child
+
+    # Return the total duration of the child spans with the given name
+    def child_duration(self, name):
+        return sum(child.duration for child in self.children if child.name == name)
+
+    # Rebuild a span from its to_dict() form, e.g. the trace of a worker process
+    @classmethod
+    def from_dict(cls, data):
+        node = cls(data['name'], data.get('attributes'))
+        node.start_time = data['start_time']
+        node.duration = data['duration']
+        node.peak_rss = data.get('peak_rss_bytes')
+        node.counts = dict(data.get('counts', {}))
+        node.children = [cls.from_dict(child) for child in data.get('children', [])]
+        return node
+
+    def to_dict(self):
+        data = {'name': self.name, 'start_time': self.start_time, 'duration': self.duration}
+        if self.attributes:
+            data['attributes'] = self.attributes
+        if self.peak_rss is not None:
+            data['peak_rss_bytes'] = self.peak_rss
+        if self.counts:
+            data['counts'] = self.counts
+            if self.duration > 0:
+                data['throughput'] = {f'{key}_per_s': value / self.duration for key, value in self.counts.items()}
+        if self.children:
+            data['children'] = [child.to_dict() for child in self.children]
+        return data
+
+# Function to return the open spans of the calling thread
+def _open_spans():
+    if not hasattr(_local, 'spans'):
+        _local.spans = []
+        # Time spent in nested traced() stages during the current next() call of each enclosing traced() stage
+        _local.generators = []
+    return _local.spans
+
+# Function to return the innermost open span of the calling thread, the root of the run, or None
+def current_span():
+    spans = _open_spans()
+    return spans[-1] if spans else _trace['root']
+
+# Function to start cProfile for a span if its stage was selected and no other span is being profiled
+def _start_profiler(name):
+    with _lock:
+        if name not in _trace['profile_stages'] or _trace['profiling']:
+            return None
+        _trace['profiling'] = True
+        _trace['profile_count'] += 1
+        path = os.path.join(_trace['profile_dir'], f"profile_{_trace['profile_count']:02d}_{name}.prof")
+    profiler = cProfile.Profile()
+    profiler.enable()
+    return profiler, path
+
+# Function to stop a profiler started by _start_profiler and save its statistics
+def _stop_profiler(node, profiling):
+    if not profiling:
+        return
+    profiler, path = profiling
+    profiler.disable()
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    profiler.dump_stats(path)
+    node.attributes['profile'] = path
+    with _lock:
+        _trace['profiling'] = False
+    logging.info(f"Profile of stage {node.name} saved to {path}")
+
+# Context manager timing a stage with perf_counter and recording its peak RSS; yields the Span
+@contextmanager
+def span(name, **attributes):
+    spans = _open_spans()
+    parent = current_span()
+    node = Span(name, attributes)
+    if parent is not None:
+        with _lock:
+            parent.children.append(node)
+
+    # Fold the peak reached so far into the enclosing span before resetting it for this one
+    if spans:
+        spans[-1].peak_rss = max(spans[-1].peak_rss or 0, read_peak_rss())
+    reset_peak_rss()
+    profiling = _start_profiler(name)
+
+    spans.append(node)
+    start_time = time.perf_counter()
+    try:
+        yield node
+    finally:
+        node.duration += time.perf_counter() - start_time
+        spans.pop()
+        node.peak_rss = max(node.peak_rss or 0, read_peak_rss())
+        if spans:
+            spans[-1].peak_rss = max(spans[-1].peak_rss or 0, node.peak_rss)
+        _stop_profiler(node, profiling)
+
+# Function to time the items of an interleaved generator stage into the child span `name` of the current span.
+# Time spent in nested traced() stages is subtracted, so every stage reports its own time only.
+def traced(iterable, name, item=None):
+    parent = current_span()
+    node = parent.child(name) if parent is not None else Span(name)
+    _open_spans()
+    generators = _local.generators
+    iterator = iter(iterable)
+    while True:
+        nested = [0.0]
+        generators.append(nested)
+        start_time = time.perf_counter()
+        try:
+            value = next(iterator)
+        except StopIteration:
+            return
+        finally:
+            generators.pop()
+            elapsed = time.perf_counter() - start_time
+            node.duration += elapsed - nested[0]
+            if generators:
+                generators[-1][0] += elapsed
+        if item:
+            node.count(item)
+        yield value
+
+# Context manager collecting all spans opened in this process into one trace for a run; yields the root Span.
+# Spans whose name is in profile_stages are profiled with cProfile into profile_dir.
+@contextmanager
+def trace_run(name, profile_stages=(), profile_dir='.', **attributes):
+    root = Span(name, dict(attributes, pid=os.getpid()))
+    _trace.update(root=root, profile_stages=set(profile_stages or ()), profile_dir=profile_dir, profile_count=0, profiling=False)
+    spans = _open_spans()
+    reset_peak_rss()
+    profiling = _start_profiler(name)
+    spans.append(root)
+    start_time = time.perf_counter()
+    try:
+        yield root
+    finally:
+        root.duration = time.perf_counter() - start_time
+        spans.remove(root)
+        root.peak_rss = max(root.peak_rss or 0, read_peak_rss())
+        _stop_profiler(root, profiling)
+        _trace.update(root=None, profile_stages=set(), profiling=False)
+
+# Function to graft the trace of another process, as returned by Span.to_dict(), under the current span
+def attach_trace(data):
+    node = Span.from_dict(data)
+    parent = current_span()
+    if parent is not None:
+        with _lock:
+            parent.children.append(node)
+    return node
+
+# Function to write the trace of a run as JSON
+def save_trace(root, path):
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w') as file:
+        json.dump(root.to_dict(), file, indent=2)
+    logging.info(f"Trace saved to {path}")
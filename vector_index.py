@@ -0,0 +1,213 @@
+import os
+import json
+import logging
+import numpy as np
+
+# hnswlib is optional, the 'hnsw' backend is only available when it is installed
+try:
+    import hnswlib
+except ImportError:
+    hnswlib = None
+
+# Maximum number of similarity scores computed at once while building an index, to bound temporary memory
+BLOCK_ELEMENTS = 16 * 1024 * 1024
+
+# Function to L2-normalize embedding rows so that dot products are cosine similarities
+def normalize_rows(embeddings):
+    embeddings = np.asarray(embeddings, dtype=np.float32)
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    return embeddings / np.maximum(norms, 1e-12)
+
+# Function to pick the k best columns of each row of a score matrix, best first and lowest id first among ties
+def top_k_rows(scores, ids, k):
+    k = min(k, scores.shape[1])
+    top_scores = np.empty((scores.shape[0], k), dtype=np.float32)
+    top_ids = np.empty((scores.shape[0], k), dtype=np.int64)
+    for row_index, row in enumerate(scores):
+        columns = np.argpartition(-row, k - 1)[:k] if k < len(row) else np.arange(len(row))
+        columns = columns[np.lexsort((ids[columns], -row[columns]))]
+        top_scores[row_index] = row[columns]
+        top_ids[row_index] = ids[columns]
+    return top_scores, top_ids
+
+# Function to assign every vector to its most similar centroid, in blocks to bound the score matrix size
+def assign_to_centroids(vectors, centroids):
+    block = max(1, BLOCK_ELEMENTS // max(len(centroids), 1))
+    return np.concatenate([
+        np.argmax(vectors[start:start + block] @ centroids.T, axis=1)
+        for start in range(0, len(vectors), block)
+    ]) if len(vectors) else np.zeros(0, dtype=np.int64)
+
+# Brute-force cosine search over the whole corpus; never persisted, it is rebuilt from the embedding cache
+class ExactIndex:
+    kind = 'exact'
+
+    def __init__(self, embeddings):
+        self.embeddings = normalize_rows(embeddings)
+
+    def __len__(self):
+        return len(self.embeddings)
+
+    def search(self, queries, k):
+        queries = normalize_rows(queries)
+        scores = queries @ self.embeddings.T
+        return top_k_rows(scores, np.arange(len(self.embeddings)), k)
+
+# Inverted-file index: a spherical k-means coarse quantizer splits the corpus into nlist lists,
+# and a query only scores the sentences of its nprobe closest lists
+class IVFIndex:
+    kind = 'ivf'
+    suffixes = ('.npz',)
+
+    def __init__(self, embeddings, nlist=None, nprobe=8, iterations=10, seed=0):
+        embeddings = normalize_rows(embeddings)
+        self.nprobe = nprobe
+        nlist = min(nlist or max(1, int(4 * np.sqrt(len(embeddings)))), len(embeddings))
+        if nlist == 0:
+            self.centroids = np.zeros((0, embeddings.shape[1]), dtype=np.float32)
+            self.ids = np.zeros(0, dtype=np.int64)
+            self.vectors = embeddings
+            self.offsets = np.zeros(1, dtype=np.int64)
+            return
+        rng = np.random.default_rng(seed)
+
+        # Train the centroids on a sample, which is plenty for a coarse quantizer
+        sample = embeddings[rng.choice(len(embeddings), min(len(embeddings), 32 * nlist), replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)]
+        for _ in range(iterations):
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, assign_to_centroids(sample, centroids), sample)
+            # Lists that lost all their members keep their previous centroid
+            empty = ~sums.any(axis=1)
+            sums[empty] = centroids[empty]
+            centroids = normalize_rows(sums)
+
+        assignments = assign_to_centroids(embeddings, centroids)
+        order = np.argsort(assignments, kind='stable')
+        self.centroids = centroids
+        self.ids = order
+        self.vectors = embeddings[order]
+        self.offsets = np.searchsorted(assignments[order], np.arange(nlist + 1))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def search(self, queries, k):
+        queries = normalize_rows(queries)
+        if not len(self.ids):
+            return np.zeros((len(queries), 0), np.float32), np.zeros((len(queries), 0), np.int64)
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argsort(-(queries @ self.centroids.T), axis=1)[:, :nprobe]
+        all_scores, all_ids = [], []
+        for query, lists in zip(queries, probes):
+            rows = np.concatenate([np.arange(self.offsets[list_id], self.offsets[list_id + 1]) for list_id in lists])
+            scores = (self.vectors[rows] @ query)[None, :]
+            top_scores, top_ids = top_k_rows(scores, self.ids[rows], k) if len(rows) else (np.zeros((1, 0), np.float32), np.zeros((1, 0), np.int64))
+            all_scores.append(top_scores[0])
+            all_ids.append(top_ids[0])
+        return pad_results(all_scores, all_ids, k)
+
+    def save(self, path):
+        np.savez(path + '.npz', centroids=self.centroids, ids=self.ids, vectors=self.vectors, offsets=self.offsets)
+
+    @classmethod
+    def load(cls, path, params):
+        data = np.load(path + '.npz')
+        index = cls.__new__(cls)
+        index.centroids, index.ids, index.vectors, index.offsets = data['centroids'], data['ids'], data['vectors'], data['offsets']
+        index.nprobe = params.get('nprobe', 8)
+        return index
+
+# Hierarchical navigable small world graph from hnswlib
+class HNSWIndex:
+    kind = 'hnsw'
+    suffixes = ('.hnsw', '.json')
+
+    def __init__(self, embeddings, M=16, ef_construction=200, ef=64):
+        if hnswlib is None:
+            raise ImportError("The 'hnsw' vector index requires the hnswlib package (pip install hnswlib)")
+        embeddings = normalize_rows(embeddings)
+        self.index = hnswlib.Index(space='ip', dim=embeddings.shape[1])
+        self.index.init_index(max_elements=max(len(embeddings), 1), ef_construction=ef_construction, M=M)
+        if len(embeddings):
+            self.index.add_items(embeddings, np.arange(len(embeddings)))
+        self.index.set_ef(ef)
+
+    def __len__(self):
+        return self.index.get_current_count()
+
+    def search(self, queries, k):
+        k = min(k, len(self))
+        if k == 0:
+            return np.zeros((len(queries), 0), np.float32), np.zeros((len(queries), 0), np.int64)
+        self.index.set_ef(max(self.index.ef, k))
+        labels, distances = self.index.knn_query(normalize_rows(queries), k=k)
+        # hnswlib reports inner-product distance as 1 - similarity
+        return (1.0 - distances).astype(np.float32), labels.astype(np.int64)
+
+    def save(self, path):
+        self.index.save_index(path + '.hnsw')
+        with open(path + '.json', 'w') as file:
+            json.dump({'dim': self.index.dim}, file)
+
+    @classmethod
+    def load(cls, path, params):
+        if hnswlib is None:
+            raise ImportError("The 'hnsw' vector index requires the hnswlib package (pip install hnswlib)")
+        with open(path + '.json') as file:
+            dim = json.load(file)['dim']
+        index = cls.__new__(cls)
+        index.index = hnswlib.Index(space='ip', dim=dim)
+        index.index.load_index(path + '.hnsw')
+        index.index.set_ef(params.get('ef', 64))
+        return index
+
+INDEX_BACKENDS = {backend.kind: backend for backend in (ExactIndex, IVFIndex, HNSWIndex)}
+
+# Function to stack per-query results of different lengths into padded arrays (-1 ids, -inf scores)
+def pad_results(all_scores, all_ids, k):
+    width = max((len(ids) for ids in all_ids), default=0)
+    scores = np.full((len(all_scores), width), -np.inf, dtype=np.float32)
+    ids = np.full((len(all_ids), width), -1, dtype=np.int64)
+    for row, (row_scores, row_ids) in enumerate(zip(all_scores, all_ids)):
+        scores[row, :len(row_scores)] = row_scores
+        ids[row, :len(row_ids)] = row_ids
+    return scores, ids
+
+# Function to build an index of the given kind over the embeddings
+def build_index(kind, embeddings, params=None):
+    if kind not in INDEX_BACKENDS:
+        raise ValueError(f"Unknown vector index '{kind}', expected one of {sorted(INDEX_BACKENDS)}")
+    return INDEX_BACKENDS[kind](embeddings, **(params or {}))
+
+# Function to list the files a persisted index of the given kind is stored in
+def index_files(kind, path):
+    return [path + suffix for suffix in INDEX_BACKENDS[kind].suffixes]
+
+# Function to check whether a persisted index exists at path
+def index_exists(kind, path):
+    return all(os.path.exists(file_path) for file_path in index_files(kind, path))
+
+# Function to persist an index; files are written under a temporary name first so readers never see partial files
+def save_index(index, path):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.tmp{os.getpid()}"
+    index.save(tmp_path)
+    for suffix in index.suffixes:
+        os.replace(tmp_path + suffix, path + suffix)
+    logging.info(f"Saved {index.kind} vector index to {path}")
+
+# Function to load a persisted index
+def load_index(kind, path, params=None):
+    logging.info(f"Loading {kind} vector index from {path}")
+    return INDEX_BACKENDS[kind].load(path, params or {})
+
+# Function to measure how many of the exact top-k neighbours an approximate search returned
+def recall_at_k(approx_ids, exact_ids):
+    found = 0
+    total = 0
+    for approx_row, exact_row in zip(approx_ids, exact_ids):
+        exact = set(int(i) for i in exact_row if i >= 0)
+        found += len(exact.intersection(int(i) for i in approx_row if i >= 0))
+        total += len(exact)
+    return found / total if total else 1.0